@@ -0,0 +1,204 @@
+import collections
+import itertools
+import os
+import time
+import traceback
+import typing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, NamedTuple, Optional, Union
+
+import numpy as np
+
+from .byte_io_wmd import ByteIO
+from .wld import World
+from .wmd import Model
+
+
+class LoadResult(NamedTuple):
+    path: str
+    data: Any  # what the extractor returned, None if loading failed
+    error: Optional[str]  # formatted traceback of the failure
+    size: int
+    seconds: float
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BatchStats:
+    """Throughput of a load_many run, updated while results are consumed"""
+
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.bytes = 0
+        self.load_seconds = 0.0  # summed over workers
+        self.start_time = time.perf_counter()
+        self.end_time = self.start_time
+
+    def add(self, result: LoadResult):
+        self.files += 1
+        self.failed += not result.ok
+        self.bytes += result.size
+        self.load_seconds += result.seconds
+        self.end_time = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return self.end_time - self.start_time
+
+    @property
+    def files_per_second(self):
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return (f"BatchStats<files:{self.files} failed:{self.failed} "
+                f"{self.bytes / 1024 / 1024:.1f}MB in {self.seconds:.2f}s, {self.files_per_second:.1f} files/s>")
+
+
+def _submesh_arrays(sub_mesh):
+    return {
+        'material_id': sub_mesh.material_id,
+        'vertices': sub_mesh.vertices,
+        'normals': sub_mesh.normals,
+        'uv_sets': dict(sub_mesh.uv_sets),
+        'bone_ids': sub_mesh.bone_ids,
+        'bone_weights': sub_mesh.bone_weights,
+        'indices': sub_mesh.indices,
+    }
+
+
+def _extract_geometry(model: Model):
+    """[mesh group][mesh][sub mesh] -> dict of arrays"""
+    return [[[_submesh_arrays(sub_mesh) for sub_mesh in sub_meshes] for sub_meshes in mesh.meshes]
+            for mesh in model.mesh.mesh_groups]
+
+
+def _extract_skeleton(model: Model):
+    armature = model.armature
+    positions, rotations = armature.rest_pose()
+    return {
+        'names': [bone.name for bone in armature.bones],
+        'parents': armature.parent_indices.astype(np.int32),
+        'positions': positions,
+        'rotations': rotations,
+    }
+
+
+def _extract_collision(model: Model):
+    return [{'vertices': np.array(mesh.vertices, np.float32).reshape(-1, 3),
+             'indices': np.array(mesh.indices, np.uint16).reshape(-1),
+             'surface_materials': mesh.surface_materials}
+            for mesh in model.collision_mesh.meshes]
+
+
+def _extract_entities(world: World):
+    return [(entity.class_name, dict(entity.kv)) for entity in world.entities]
+
+
+# what=... -> (model sections the extractor needs, extractor)
+MODEL_EXTRACTORS = {
+    'geometry': (('bodygroups',), _extract_geometry),
+    'skeleton': (('model_data',), _extract_skeleton),
+    'collision': (('collision',), _extract_collision),
+    'materials': (('model_data',), lambda model: list(model.materials)),
+}
+WORLD_EXTRACTORS = {
+    'entities': _extract_entities,
+    'materials': lambda world: list(world.materials),
+}
+
+
+def _load_file(path, what):
+    start = time.perf_counter()
+    size = 0
+    try:
+        size = os.path.getsize(path)
+        if what == 'scan':
+            data = Model.scan_file(path)
+            if data is None:
+                raise ValueError(f"{path} is not a model file")
+            return LoadResult(str(path), data, None, size, time.perf_counter() - start)
+        reader = ByteIO(path=path)
+        if Model.check_header(reader):
+            if callable(what):
+                model = Model()
+                model.from_file(reader)
+                data = what(model)
+            else:
+                sections, extractor = MODEL_EXTRACTORS[what]
+                model = Model()
+                model.read_index(reader)
+                for section in sections:
+                    model.load_section(section)
+                data = extractor(model)
+        elif World.check_header(reader):
+            world = World()
+            world.from_file(reader)
+            data = what(world) if callable(what) else WORLD_EXTRACTORS[what](world)
+        else:
+            raise ValueError(f"{path} is neither a model nor a world file")
+        return LoadResult(str(path), data, None, size, time.perf_counter() - start)
+    except Exception:
+        return LoadResult(str(path), None, traceback.format_exc(), size, time.perf_counter() - start)
+
+
+def load_many(paths: Iterable[Union[str, os.PathLike]], workers=None,
+              what: Union[str, Callable[[Any], Any]] = 'geometry',
+              ordered=True, stats: Optional[BatchStats] = None, threads=False) -> typing.Iterator[LoadResult]:
+    """
+    Loads WMD and WLD files on a pool of worker processes and yields a LoadResult per file.
+    :param what: name from MODEL_EXTRACTORS/WORLD_EXTRACTORS, 'scan' for a header scan of models,
+    or a picklable (module level) function called with the loaded Model or World
+    :param ordered: yield results in the order of paths instead of as they complete
+    :param stats: BatchStats updated with every yielded result
+    :param threads: use a thread pool instead, results aren't pickled and I/O waits overlap,
+    but parsing itself doesn't run in parallel
+    Failures never stop the batch, they are returned as results with error set.
+    """
+    if not callable(what) and what != 'scan' and what not in MODEL_EXTRACTORS and what not in WORLD_EXTRACTORS:
+        raise ValueError(f"Unknown extractor {what!r}")
+    if stats is None:
+        stats = BatchStats()
+    executor_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    # only a bounded window of files is in flight, results are dropped as soon as they're yielded
+    window = (workers or os.cpu_count() or 1) * 2
+    paths = iter(paths)
+    with executor_class(max_workers=workers) as executor:
+        def submit(count):
+            for path in itertools.islice(paths, count):
+                pending.append(executor.submit(_load_file, path, what))
+
+        if ordered:
+            pending = collections.deque()
+            submit(window)
+            while pending:
+                result = pending.popleft().result()
+                submit(1)
+                stats.add(result)
+                yield result
+        else:
+            pending = []
+            submit(window)
+            while pending:
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                pending = list(not_done)
+                submit(len(done))
+                for future in done:
+                    result = future.result()
+                    stats.add(result)
+                    yield result
+                del done
+
+if __name__ == '__main__':
+    import sys
+
+    batch_stats = BatchStats()
+    for load_result in load_many(sys.argv[1:], what='scan', ordered=False, stats=batch_stats):
+        print(load_result.path, load_result.data if load_result.ok else load_result.error)
+    print(batch_stats)
@@ -1,10 +1,16 @@
 import binascii
 import contextlib
 import io
+import json
+import mmap
 import struct
+import sys
+import time
 import typing
 from io import BytesIO
 
+import numpy as np
+
 
 class OffsetOutOfBounds(Exception):
     pass
@@ -14,6 +20,148 @@ def split(array, n=3):
     return [array[i:i + n] for i in range(0, len(array), n)]
 
 
+class StreamSink:
+    """
+    Append-only, write-only file object that keeps track of how many bytes went through it.
+    Data is forwarded to target (any writable binary stream, pipes included)
+    or dropped when there is no target, which is enough to lay out a file without storing it.
+    """
+    mode = 'wb'
+
+    def __init__(self, target=None):
+        self.target = target
+        self.position = 0
+
+    def write(self, data):
+        if self.target is not None:
+            self.target.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def seek(self, off, pos=io.SEEK_SET):
+        if pos != io.SEEK_SET:
+            off += self.position
+        if off != self.position:
+            raise io.UnsupportedOperation("StreamSink can't seek")
+        return self.position
+
+    def read(self, size=-1):
+        raise io.UnsupportedOperation("StreamSink is write-only")
+
+    def close(self):
+        pass
+
+
+class _ProfiledSection:
+    def __init__(self, profiler, reader, name):
+        self._profiler = profiler
+        self._reader = reader
+        self._name = name
+        self._start_offset = 0
+        self._start_time = 0.0
+        self.count = 0
+
+    def __enter__(self):
+        self._profiler._enter(self._name)
+        self._start_offset = self._reader.tell()
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = time.perf_counter() - self._start_time
+        self._profiler._exit(self._reader.tell() - self._start_offset, elapsed, self.count)
+        return False
+
+
+class _NoProfiling:
+    """Shared stand-in section used while profiling is disabled"""
+    count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def __setattr__(self, key, value):
+        pass
+
+
+_NO_PROFILING = _NoProfiling()
+
+
+class ReadProfiler:
+    """
+    Records bytes consumed, wall time and object count per named section of a file.
+    Attach it with ByteIO.profiler, sections opened inside other sections nest,
+    repeated sections with the same name are summed up.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self._stack = [{'sections': self.sections}]
+
+    def _enter(self, name):
+        records = self._stack[-1]['sections']
+        record = records.get(name)
+        if record is None:
+            record = records[name] = {'bytes': 0, 'seconds': 0.0, 'count': 0, 'calls': 0, 'sections': {}}
+        self._stack.append(record)
+
+    def _exit(self, size, elapsed, count):
+        record = self._stack.pop()
+        record['bytes'] += size
+        record['seconds'] += elapsed
+        record['count'] += count
+        record['calls'] += 1
+
+    def section(self, reader, name):
+        return _ProfiledSection(self, reader, name)
+
+    def report(self):
+        return self.sections
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.sections, **kwargs)
+
+
+class _StructCache(dict):
+    """Compiled struct.Struct per format string, so formats are parsed only once."""
+
+    def __missing__(self, fmt):
+        compiled = self[fmt] = struct.Struct(fmt)
+        return compiled
+
+
+_STRUCTS = _StructCache()
+_UINT64 = _STRUCTS['Q']
+_INT64 = _STRUCTS['q']
+_UINT32 = _STRUCTS['I']
+_INT32 = _STRUCTS['i']
+_UINT16 = _STRUCTS['H']
+_INT16 = _STRUCTS['h']
+_UINT8 = _STRUCTS['B']
+_INT8 = _STRUCTS['b']
+_FLOAT = _STRUCTS['f']
+_DOUBLE = _STRUCTS['d']
+_FLOAT16 = _STRUCTS['e']
+
+
+def _map_file(file):
+    """
+    Memory-maps an open file handle, empty files can't be mapped and are read instead.
+    :type file: typing.BinaryIO
+    """
+    with file:
+        try:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return io.BytesIO(file.read())
+
+
 class ByteIO:
     @contextlib.contextmanager
     def save_current_pos(self):
@@ -22,16 +170,25 @@ class ByteIO:
         self.seek(entry)
 
     def __init__(self, file=None, path=None, byte_object=None,
-                 mode='r', copy_data_from_handle=True):
+                 mode='r', copy_data_from_handle=True, memory_map=False):
         """
         Supported file handlers
+        With memory_map=True files opened for reading are mapped instead of copied,
+        read_view and read_array then return views of the mapping.
         :type byte_object: bytes
         :type path: str
         :type file: typing.BinaryIO
         """
+        self._view = None
+        self._offset_slots = {}
+        self._offsets = {}
+        self.profiler = None  # type: typing.Optional[ReadProfiler]
+        self.context = None  # type: typing.Optional['ParseContext']
         if file:
             if 'w' in file.mode:
                 self.file = file
+            elif 'r' in file.mode and memory_map:
+                self.file = _map_file(file)
             elif 'r' in file.mode and copy_data_from_handle:
                 self.file = io.BytesIO(file.read())
                 file.close()
@@ -40,6 +197,8 @@ class ByteIO:
         elif path:
             if 'w' in mode:
                 self.file = open(path, mode + 'b')
+            elif 'r' in mode and memory_map:
+                self.file = _map_file(open(path, 'rb'))
             elif 'r' in mode:
                 with open(path, mode + 'b') as f:
                     self.file = io.BytesIO(f.read())
@@ -48,6 +207,8 @@ class ByteIO:
             self.file = io.BytesIO(byte_object)
         else:
             self.file = BytesIO()
+        if isinstance(self.file, mmap.mmap):
+            self._view = memoryview(self.file)
 
     @property
     def preview(self):
@@ -65,10 +226,30 @@ class ByteIO:
         return "<ByteIO {}/{}>".format(self.tell(), self.size())
 
     def close(self):
-        if hasattr(self.file, 'mode'):
+        if self._view is not None:
+            try:
+                self._view.release()
+                self.file.close()
+            except BufferError:
+                # views returned by read_view or read_array are still alive, mapping is freed together with them
+                pass
+        elif hasattr(self.file, 'mode'):
             if 'w' in getattr(self.file, 'mode'):
                 self.file.close()
 
+    @property
+    def memory_mapped(self):
+        return self._view is not None
+
+    def profile(self, name):
+        """
+        Context manager marking a section for the attached ReadProfiler, does nothing without one.
+        Set count on the returned section to record how many objects it produced.
+        """
+        if self.profiler is None:
+            return _NO_PROFILING
+        return self.profiler.section(self, name)
+
     def rewind(self, amount):
         self.file.seek(-amount, io.SEEK_CUR)
 
@@ -89,8 +270,8 @@ class ByteIO:
         return ret
 
     def fill(self, amount):
-        for _ in range(amount):
-            self._write(b'\x00')
+        if amount > 0:
+            self._write(bytes(amount))
 
     def insert_begin(self, to_insert):
         self.seek(0)
@@ -105,46 +286,48 @@ class ByteIO:
     # ------------ PEEK SECTION ------------ #
 
     def _peek(self, size=1):
-        with self.save_current_pos():
-            return self._read(size)
+        offset = self.file.tell()
+        data = self.file.read(size)
+        self.file.seek(offset)
+        return data
 
     def peek(self, t):
-        size = struct.calcsize(t)
-        return struct.unpack(t, self._peek(size))[0]
+        compiled = _STRUCTS[t]
+        return compiled.unpack(self._peek(compiled.size))[0]
 
     def peek_fmt(self, fmt):
-        size = struct.calcsize(fmt)
-        return struct.unpack(fmt, self._peek(size))
+        compiled = _STRUCTS[fmt]
+        return compiled.unpack(self._peek(compiled.size))
 
     def peek_uint64(self):
-        return self.peek('Q')
+        return _UINT64.unpack(self._peek(8))[0]
 
     def peek_int64(self):
-        return self.peek('q')
+        return _INT64.unpack(self._peek(8))[0]
 
     def peek_uint32(self):
-        return self.peek('I')
+        return _UINT32.unpack(self._peek(4))[0]
 
     def peek_int32(self):
-        return self.peek('i')
+        return _INT32.unpack(self._peek(4))[0]
 
     def peek_uint16(self):
-        return self.peek('H')
+        return _UINT16.unpack(self._peek(2))[0]
 
     def peek_int16(self):
-        return self.peek('h')
+        return _INT16.unpack(self._peek(2))[0]
 
     def peek_uint8(self):
-        return self.peek('B')
+        return _UINT8.unpack(self._peek(1))[0]
 
     def peek_int8(self):
-        return self.peek('b')
+        return _INT8.unpack(self._peek(1))[0]
 
     def peek_float(self):
-        return self.peek('f')
+        return _FLOAT.unpack(self._peek(4))[0]
 
     def peek_double(self):
-        return self.peek('d')
+        return _DOUBLE.unpack(self._peek(8))[0]
 
     def peek_fourcc(self):
         with self.save_current_pos():
@@ -156,54 +339,77 @@ class ByteIO:
         return self.file.read(size)
 
     def read(self, t):
-        size = struct.calcsize(t)
-        return struct.unpack(t, self._read(size))[0]
+        compiled = _STRUCTS[t]
+        return compiled.unpack(self.file.read(compiled.size))[0]
 
     def read_fmt(self, fmt):
-        size = struct.calcsize(fmt)
-        return struct.unpack(fmt, self._read(size))
+        compiled = _STRUCTS[fmt]
+        return compiled.unpack(self.file.read(compiled.size))
 
     def read_uint64(self):
-        return self.read('Q')
+        return _UINT64.unpack(self.file.read(8))[0]
 
     def read_int64(self):
-        return self.read('q')
+        return _INT64.unpack(self.file.read(8))[0]
 
     def read_uint32(self):
-        return self.read('I')
+        return _UINT32.unpack(self.file.read(4))[0]
 
     def read_int32(self):
-        return self.read('i')
+        return _INT32.unpack(self.file.read(4))[0]
 
     def read_uint16(self):
-        return self.read('H')
+        return _UINT16.unpack(self.file.read(2))[0]
 
     def read_int16(self):
-        return self.read('h')
+        return _INT16.unpack(self.file.read(2))[0]
 
     def read_uint8(self):
-        return self.read('B')
+        return _UINT8.unpack(self.file.read(1))[0]
 
     def read_int8(self):
-        return self.read('b')
+        return _INT8.unpack(self.file.read(1))[0]
 
     def read_float(self):
-        return self.read('f')
+        return _FLOAT.unpack(self.file.read(4))[0]
 
     def read_double(self):
-        return self.read('d')
-
-    def read_ascii_string(self, length=None):
+        return _DOUBLE.unpack(self.file.read(8))[0]
+
+    def _read_zero_terminated(self):
+        if self._view is not None:
+            start = self.file.tell()
+            end = self.file.find(b'\x00', start)
+            if end == -1:
+                raise struct.error('unterminated string')
+            self.file.seek(end + 1)
+            return self._view[start:end]
+        chunks = []
+        chunk_size = 64
+        while True:
+            chunk = self._read(chunk_size)
+            end = chunk.find(b'\x00')
+            if end != -1:
+                self.rewind(len(chunk) - end - 1)
+                chunks.append(chunk[:end])
+                return b''.join(chunks)
+            if len(chunk) < chunk_size:
+                raise struct.error('unterminated string')
+            chunks.append(chunk)
+            chunk_size *= 2
+
+    def read_ascii_string(self, length=None, intern=False):
+        """
+        Reads fixed length string if length is given, otherwise reads up to the zero terminator.
+        Pass intern=True for strings that repeat a lot, like key names.
+        """
         if length:
-            return bytes(''.join([chr(self.read_uint8()) for _ in range(
-                length)]), 'utf').strip(b'\x00').decode('utf')
-
-        acc = ''
-        b = self.read_uint8()
-        while b != 0:
-            acc += chr(b)
-            b = self.read_uint8()
-        return acc
+            string = bytes(self._read(length)).strip(b'\x00').decode('latin-1')
+        else:
+            string = str(self._read_zero_terminated(), 'latin-1')
+        if intern:
+            return sys.intern(string)
+        return string
 
     def read_fourcc(self):
         return self.read_ascii_string(4)
@@ -224,52 +430,49 @@ class ByteIO:
         self.file.write(data)
 
     def write(self, t, value):
-        self._write(struct.pack(t, value))
+        self.file.write(_STRUCTS[t].pack(value))
 
     def write_fmt(self, t, *value):
-        self._write(struct.pack(t, *value))
+        self.file.write(_STRUCTS[t].pack(*value))
 
     def write_uint64(self, value):
-        self.write('Q', value)
+        self.file.write(_UINT64.pack(value))
 
     def write_int64(self, value):
-        self.write('q', value)
+        self.file.write(_INT64.pack(value))
 
     def write_uint32(self, value):
-        self.write('I', value)
+        self.file.write(_UINT32.pack(value))
 
     def write_int32(self, value):
-        self.write('i', value)
+        self.file.write(_INT32.pack(value))
 
     def write_uint16(self, value):
-        self.write('H', value)
+        self.file.write(_UINT16.pack(value))
 
     def write_int16(self, value):
-        self.write('h', value)
+        self.file.write(_INT16.pack(value))
 
     def write_uint8(self, value):
-        self.write('B', value)
+        self.file.write(_UINT8.pack(value))
 
     def write_int8(self, value):
-        self.write('b', value)
+        self.file.write(_INT8.pack(value))
 
     def write_float(self, value):
-        self.write('f', value)
+        self.file.write(_FLOAT.pack(value))
 
     def write_double(self, value):
-        self.write('d', value)
+        self.file.write(_DOUBLE.pack(value))
 
     def write_ascii_string(self, string, zero_terminated=True, length=-1):
-        pos = self.tell()
-        for c in string:
-            self._write(c.encode('ascii'))
+        data = string.encode('ascii')
         if zero_terminated:
-            self._write(b'\x00')
-        elif length != -1:
-            to_fill = length - (self.tell() - pos)
-            if to_fill > 0:
-                for _ in range(to_fill):
-                    self.write_uint8(0)
+            self._write(data + b'\x00')
+        else:
+            self._write(data)
+            if length != -1:
+                self.fill(length - len(data))
 
     def write_fourcc(self, fourcc):
         self.write_ascii_string(fourcc)
@@ -283,25 +486,86 @@ class ByteIO:
         self.seek(curr_offset, io.SEEK_SET)
         return ret
 
+    # ------------ OFFSET SLOTS ------------ #
+
+    def reserve_offset(self, name, t='Q'):
+        """
+        Writes a placeholder for the offset called name, it's filled in by resolve_offsets().
+        Offsets already known (see mark_offset) are written right away.
+        """
+        value = self._offsets.get(name, 0)
+        self._offset_slots[name] = (self.tell(), t, value)
+        self.write(t, value)
+
+    def mark_offset(self, name, value=None):
+        """Sets the offset called name, current position by default"""
+        self._offsets[name] = self.tell() if value is None else value
+
+    @property
+    def offsets(self):
+        return dict(self._offsets)
+
+    def resolve_offsets(self):
+        """
+        Fills all reserved offset slots in a single pass and forgets them.
+        Slots that already hold the right value are left alone, so nothing is patched
+        when all offsets were known up front.
+        """
+        slots = [(offset, t, self._offsets[name]) for name, (offset, t, written) in self._offset_slots.items()
+                 if self._offsets.get(name, written) != written]
+        self._offset_slots.clear()
+        if not slots:
+            return
+        if isinstance(self.file, BytesIO):
+            with self.file.getbuffer() as buffer:
+                for offset, t, value in slots:
+                    _STRUCTS[t].pack_into(buffer, offset, value)
+            return
+        with self.save_current_pos():
+            for offset, t, value in slots:
+                self.seek(offset)
+                self.write(t, value)
+
     def read_bytes(self, size):
         return self._read(size)
 
+    def read_view(self, size):
+        """
+        read_bytes without the copy in memory_map mode: a memoryview slice that keeps the mapping open,
+        don't store it in parsed objects, use read_bytes for data that outlives the read.
+        """
+        if self._view is not None:
+            offset = self.file.tell()
+            data = self._view[offset:] if size < 0 else self._view[offset:offset + size]
+            self.file.seek(offset + len(data))
+            return data
+        return self._read(size)
+
     def read_float16(self):
-        return self.read('e')
+        return _FLOAT16.unpack(self.file.read(2))[0]
+
+    def read_array(self, dtype, count):
+        """
+        Reads count items of dtype in one go, structured dtypes read interleaved records.
+        Returned array is a read-only view of the data (of the mapping in memory_map mode).
+        :rtype: np.ndarray
+        """
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self.read_view(dtype.itemsize * count), dtype, count)
 
     def write_bytes(self, data):
         self._write(data)
 
+    def write_array(self, array, dtype=None):
+        self._write(np.ascontiguousarray(array, dtype).tobytes())
+
     def write_float16(self, data: float):
-        flt_int32 = struct.unpack('I', struct.pack('f', data))[0]
-        flt_int16 = (flt_int32 >> 31) << 5
-        tmp = (flt_int32 >> 23) & 0xff
-        tmp = (tmp - 0x70) & struct.unpack('I', struct.pack('i', (0x70 - tmp) >> 4))[0] >> 27
-        flt_int16 = (flt_int16 | tmp) << 10
-        flt_int16 |= (flt_int32 >> 13) & 0x3ff
-        if flt_int32 & 0x80000000:
-            flt_int16 |= 0x8000
-        self._write(struct.pack('H', flt_int16))
+        try:
+            self.file.write(_FLOAT16.pack(data))
+        except OverflowError:
+            # out of half float range, round to infinity like the bulk conversion does
+            with np.errstate(over='ignore'):
+                self.file.write(np.float16(data).tobytes())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,419 @@
+import gc
+import hashlib
+import io
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional, Union
+
+import numpy as np
+
+from .byte_io_wmd import ByteIO
+from .wld import World
+from .wmd import Model, SECTIONS
+
+CACHE_MAGIC = b'WMDCACHE'
+CACHE_VERSION = 5  # bumped whenever pickled model classes change layout
+CACHE_EXTENSION = '.wmdc'
+# magic, version, header length, model length, data offset. The header itself is JSON
+_CACHE_HEADER = struct.Struct('<8sIQQQ')
+# smaller arrays are cheaper to keep inside the pickle than to map
+_MIN_MAPPED_BYTES = 256
+_ALIGNMENT = 64
+# the only globals a cached model may refer to: model classes and what NumPy pickles arrays with
+_MODEL_PACKAGES = tuple(f'{__package__}.{name}.' for name in ('shared', 'wmd', 'wld'))
+_NUMPY_GLOBALS = {
+    ('numpy', 'dtype'),
+    ('numpy._core.numeric', '_frombuffer'),
+    ('numpy.core.numeric', '_frombuffer'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', 'scalar'),
+    ('numpy.core.multiarray', 'scalar'),
+    ('numpy', 'ndarray'),
+}
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _ArrayPickler(pickle.Pickler):
+    """Pickles the model while moving its NumPy arrays out of the pickle stream"""
+
+    def __init__(self, file):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.arrays = []
+
+    def persistent_id(self, obj):
+        if type(obj) is not np.ndarray and not isinstance(obj, np.memmap):
+            return None
+        if obj.dtype.hasobject or obj.dtype.fields is not None or obj.nbytes < _MIN_MAPPED_BYTES:
+            return None
+        self.arrays.append(np.ascontiguousarray(obj))
+        return len(self.arrays) - 1
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    def __init__(self, file, data: np.ndarray, arrays):
+        super().__init__(file)
+        self._data = data
+        self._arrays = arrays
+
+    def find_class(self, module, name):
+        if (module, name) in _NUMPY_GLOBALS:
+            return super().find_class(module, name)
+        if (module + '.').startswith(_MODEL_PACKAGES) and '.' not in name:
+            value = super().find_class(module, name)
+            if isinstance(value, type):
+                return value
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a model cache")
+
+    def persistent_load(self, array_id):
+        offset, dtype, shape = self._arrays[array_id]
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        return self._data[offset:offset + size].view(dtype).reshape(shape)
+
+
+class ModelDiskCache:
+    """
+    Opt-in on-disk cache of parsed models.
+    Each model is stored in a single file: a small validation header, the pickled model
+    and the raw data of every geometry and animation array, which is memory-mapped
+    (copy on write) on load instead of parsed again.
+    Entries are validated against the source size and mtime, and its content hash with verify_hash=True.
+
+    Models are stored with pickle, restricted on load to model classes and NumPy arrays,
+    still keep the cache directory private to the user.
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, verify_hash=False):
+        """
+        :param directory: trusted directory cache files are kept in
+        :param max_bytes: size cap of the cache directory, least recently used entries are evicted first
+        :param verify_hash: also compare the sha1 of the source, slower but catches edits that keep size and mtime
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.verify_hash = verify_hash
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def cache_path(self, path):
+        path = os.path.abspath(path)
+        name = hashlib.sha1(path.encode('utf8')).hexdigest()
+        return os.path.join(self.directory, name + CACHE_EXTENSION)
+
+    def _source_info(self, path, stat=None, data=None):
+        """Stamp of the source file, stat and data can be taken beforehand, data are the contents to hash"""
+        stat = stat or os.stat(path)
+        if data is not None:
+            digest = hashlib.sha1(data).hexdigest()
+        else:
+            digest = _file_hash(path) if self.verify_hash else None
+        return {
+            'source': os.path.abspath(path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': digest,
+        }
+
+    def load(self, path) -> Model:
+        """Returns the cached model if it's still valid, otherwise parses the file and caches the result"""
+        model = self.get(path)
+        if model is not None:
+            return model
+        # the file is read once, the stamp is taken before it's read and the hash of the same bytes is parsed,
+        # so a file rewritten in between can only make the entry stale, never wrongly valid
+        stat = os.stat(path)
+        with open(path, 'rb') as file:
+            data = file.read()
+        source_info = self._source_info(path, stat, data)
+        model = Model()
+        model.from_file(ByteIO(byte_object=data))
+        self._store(path, model, source_info)
+        return model
+
+    def get(self, path) -> Optional[Model]:
+        cache_path = self.cache_path(path)
+        try:
+            model = self._read(cache_path, self._source_info(path))
+        except FileNotFoundError:
+            model = None
+        except (OSError, ValueError, TypeError, KeyError, EOFError, ImportError, AttributeError,
+                pickle.UnpicklingError, struct.error):
+            # damaged or written by an older version, or refers to classes that no longer exist
+            self.invalidate(path)
+            model = None
+        if model is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        os.utime(cache_path)  # mtime of cache files is their last use
+        return model
+
+    def _read(self, cache_path, source_info):
+        with open(cache_path, 'rb') as file:
+            magic, version, header_size, model_size, data_offset = _CACHE_HEADER.unpack(
+                file.read(_CACHE_HEADER.size))
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                raise ValueError("not a model cache file")
+            header = json.loads(file.read(header_size).decode('utf8'))
+            if any(header[key] != source_info[key] for key in ('source', 'size', 'mtime')):
+                return None
+            if source_info['hash'] is not None and header['hash'] != source_info['hash']:
+                return None
+            model_data = file.read(model_size)
+        if header['arrays']:
+            data = np.memmap(cache_path, np.uint8, 'c', data_offset)
+        else:
+            data = np.empty(0, np.uint8)
+        # unpickling creates lots of small objects, cyclic collections in between would dominate the load
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return _ArrayUnpickler(io.BytesIO(model_data), data, header['arrays']).load()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def store(self, path, model: Model):
+        """
+        Writes model to the cache, model has to be loaded from path without lazy geometry.
+        The entry is stamped with the file as it is now, load() avoids races with files rewritten after parsing
+        """
+        source_info = self._source_info(path)
+        if source_info['hash'] is None:
+            source_info['hash'] = _file_hash(path)  # lets the entry be used with verify_hash later
+        self._store(path, model, source_info)
+
+    def _store(self, path, model: Model, header):
+        for name in SECTIONS:
+            model.load_section(name)
+        model_stream = io.BytesIO()
+        pickler = _ArrayPickler(model_stream)
+        pickler.dump(model)
+
+        arrays = []
+        offset = 0
+        for array in pickler.arrays:
+            arrays.append((offset, array.dtype.str, array.shape))
+            offset = _align(offset + array.nbytes)
+        header['arrays'] = arrays
+        header_data = json.dumps(header).encode('utf8')
+        model_data = model_stream.getbuffer()
+        data_offset = _align(_CACHE_HEADER.size + len(header_data) + len(model_data))
+
+        cache_path = self.cache_path(path)
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(_CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(header_data), len(model_data), data_offset))
+            file.write(header_data)
+            file.write(model_data)
+            for (array_offset, _, _), array in zip(arrays, pickler.arrays):
+                file.seek(data_offset + array_offset)
+                file.write(array.data)
+        os.replace(temp_path, cache_path)
+        self._evict()
+
+    def invalidate(self, path):
+        try:
+            os.remove(self.cache_path(path))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(CACHE_EXTENSION):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    @property
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, cache_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(cache_path)
+            except OSError:
+                # still mapped on some platforms, try again on next store
+                continue
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        for _, _, cache_path in self._entries():
+            os.remove(cache_path)
+
+
+def estimate_size(obj):
+    """
+    Approximate memory footprint of an object graph in bytes,
+    array data is counted once no matter how many views share it.
+    """
+    total = 0
+    seen = set()
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, mmap.mmap):
+            total += len(obj)
+            continue
+        total += sys.getsizeof(obj)
+        if isinstance(obj, np.ndarray):
+            if obj.base is not None:
+                stack.append(obj.base)
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+    return total
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class _CacheEntry:
+    def __init__(self, value, stamp, size):
+        self.value = value
+        self.stamp = stamp
+        self.size = size
+
+
+class ModelCache:
+    """
+    In-process LRU cache of loaded models and worlds, bounded by their estimated memory footprint.
+    Entries are reloaded when the file changes, concurrent loads of the same path are done only once.
+    Cached objects are shared between callers and shouldn't be modified.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 ** 2, disk_cache: Optional[ModelDiskCache] = None):
+        """
+        :param max_bytes: memory budget, objects larger than it are returned but not kept
+        :param disk_cache: load models through a ModelDiskCache instead of parsing them
+        """
+        self.max_bytes = max_bytes
+        self.disk_cache = disk_cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.deduplicated = 0  # loads that waited for the same path being loaded by another thread
+        self.size = 0
+        self._entries = OrderedDict()  # type: OrderedDict[str,_CacheEntry]
+        self._loading = {}  # type: dict[str,Future]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self._entries
+
+    def load(self, path) -> Union[Model, World]:
+        path = os.path.abspath(path)
+        stamp = _file_stamp(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                if entry.stamp == stamp:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return entry.value
+                self._remove(path)
+            future = self._loading.get(path)
+            owner = future is None
+            if owner:
+                future = self._loading[path] = Future()
+                self.misses += 1
+            else:
+                self.deduplicated += 1
+        if not owner:
+            return future.result()
+
+        try:
+            value = self._load(path)
+            size = estimate_size(value)
+        except BaseException as ex:
+            with self._lock:
+                del self._loading[path]
+            future.set_exception(ex)
+            raise
+        with self._lock:
+            del self._loading[path]
+            if size <= self.max_bytes:
+                self._entries[path] = _CacheEntry(value, stamp, size)
+                self.size += size
+                self._evict()
+        future.set_result(value)
+        return value
+
+    def _load(self, path):
+        reader = ByteIO(file=open(path, 'rb'), copy_data_from_handle=False)
+        try:
+            is_model = Model.check_header(reader)
+            is_world = not is_model and World.check_header(reader)
+        finally:
+            reader.file.close()
+        if is_world:
+            world = World()
+            world.from_file(ByteIO(path=path))
+            return world
+        if not is_model:
+            raise ValueError(f"{path} is neither a model nor a world file")
+        if self.disk_cache is not None:
+            return self.disk_cache.load(path)
+        model = Model()
+        model.from_file(ByteIO(path=path))
+        return model
+
+    def _remove(self, path):
+        entry = self._entries.pop(path)
+        self.size -= entry.size
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            path = next(iter(self._entries))
+            self._remove(path)
+            self.evictions += 1
+
+    def invalidate(self, path):
+        with self._lock:
+            if os.path.abspath(path) in self._entries:
+                self._remove(os.path.abspath(path))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
@@ -1,6 +1,7 @@
-from .modules.base import PragmaBase
+from .modules.base import PragmaBase, ParseContext, index_in
 from .modules.vector import (Vector2F,
                              Vector3F,
                              Vector3H,
                              Vector3HF,
-                             Vector4F)
+                             Vector4F,
+                             vector_array)
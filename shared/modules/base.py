@@ -1,16 +1,68 @@
-import typing
-
 from ...byte_io_wmd import ByteIO
 
 
-class PragmaBase:
-    base = None
+class ParseContext:
+    """
+    State of a single load or save, carried by the reader/writer as reader.context,
+    so any number of files can be parsed at the same time.
+    """
+
+    def __init__(self, owner, version, lazy_geometry=False):
+        """
+        :param owner: Model or World being read or written
+        :param version: file version, MAX_SUPPORTED_VERSION when writing
+        :param lazy_geometry: sub meshes only decode their geometry on first access
+        """
+        self.owner = owner
+        self.version = version
+        self.lazy_geometry = lazy_geometry
+        self._index_maps = {}
+        self._map_index = 0
+
+    def index(self, values: list, value, by_identity=True):
+        """
+        values.index(value) through a map built on first use, so writing back-references stays linear.
+        values must not change for the rest of the load or save.
+        :param by_identity: look objects up by identity, use False for values like strings
+        """
+        index_map = self._index_maps.get(id(values))
+        if index_map is None:
+            keys = map(id, values) if by_identity else values
+            indices = {}
+            for i, key in enumerate(keys):
+                indices.setdefault(key, i)
+            # values are kept so their id can't be reused by another list
+            index_map = self._index_maps[id(values)] = (values, indices)
+        try:
+            return index_map[1][id(value) if by_identity else value]
+        except KeyError:
+            raise ValueError(f"{value!r} is not in list") from None
+
+    def next_map_index(self):
+        """Map index of the next entity read, numbered from 1 in every world"""
+        self._map_index += 1
+        return self._map_index
+
+    @property
+    def blend_controllers(self):
+        return self.owner.blend_controllers
 
-    @classmethod
-    def set_base(cls, model):
-        from ...wmd.wmd_file import Model
-        from ...wld.wld_file import World
-        cls.base: typing.Union[Model, World] = model
+    @property
+    def mesh(self):
+        return self.owner.mesh
+
+
+def index_in(stream, values: list, value, by_identity=True):
+    """
+    stream.context.index(values, value), or values.index(value)
+    for streams written outside of a Model or World save
+    """
+    if stream.context is None:
+        return values.index(value)
+    return stream.context.index(values, value, by_identity)
+
+
+class PragmaBase:
 
     def to_file(self, writer: ByteIO):
         raise NotImplemented
@@ -0,0 +1,70 @@
+"""
+Vectorized quaternion math on arrays of w,x,y,z quaternions (the order WMD stores them in).
+Every function works on any leading shape, (...,4) quaternions and (...,3) vectors broadcast against each other.
+"""
+import numpy as np
+
+IDENTITY = np.array([1.0, 0.0, 0.0, 0.0], np.float32)
+
+
+def normalize(q):
+    length = np.linalg.norm(q, axis=-1, keepdims=True)
+    return q / np.where(length == 0, 1, length)
+
+
+def conjugate(q):
+    return q * np.array([1, -1, -1, -1], q.dtype)
+
+
+def multiply(a, b):
+    """Hamilton product a*b, rotation b followed by rotation a"""
+    aw, ax, ay, az = np.moveaxis(a, -1, 0)
+    bw, bx, by, bz = np.moveaxis(b, -1, 0)
+    return np.stack((aw * bw - ax * bx - ay * by - az * bz,
+                     aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw), axis=-1)
+
+
+def rotate(q, v):
+    """Rotates vectors v by unit quaternions q"""
+    w = q[..., :1]
+    u = q[..., 1:]
+    t = 2 * np.cross(u, v)
+    return v + w * t + np.cross(u, t)
+
+
+def slerp(a, b, t, epsilon=1e-6):
+    """
+    Spherical interpolation between unit quaternions along the shortest arc.
+    :param t: interpolation factors, broadcast against a and b without the last axis
+    """
+    t = np.asarray(t, a.dtype)[..., None]
+    cos_theta = np.sum(a * b, axis=-1, keepdims=True)
+    b = np.where(cos_theta < 0, -b, b)
+    cos_theta = np.abs(cos_theta)
+    # nearly equal rotations: fall back to normalized lerp to avoid dividing by sin(0)
+    near = cos_theta > 1 - epsilon
+    theta = np.arccos(np.clip(cos_theta, -1, 1))
+    sin_theta = np.where(near, 1, np.sin(theta))
+    scale_a = np.where(near, 1 - t, np.sin((1 - t) * theta) / sin_theta)
+    scale_b = np.where(near, t, np.sin(t * theta) / sin_theta)
+    return normalize(scale_a * a + scale_b * b)
+
+
+def to_matrix(q):
+    """(...,4) unit quaternions to (...,3,3) rotation matrices"""
+    w, x, y, z = np.moveaxis(q, -1, 0)
+    xx, yy, zz = x * x, y * y, z * z
+    xy, xz, yz = x * y, x * z, y * z
+    wx, wy, wz = w * x, w * y, w * z
+    return np.stack((np.stack((1 - 2 * (yy + zz), 2 * (xy - wz), 2 * (xz + wy)), axis=-1),
+                     np.stack((2 * (xy + wz), 1 - 2 * (xx + zz), 2 * (yz - wx)), axis=-1),
+                     np.stack((2 * (xz - wy), 2 * (yz + wx), 1 - 2 * (xx + yy)), axis=-1)), axis=-2)
+
+
+def angle_between(a, b):
+    """Rotation angle in radians between unit quaternions"""
+    # atan2 of the relative rotation stays accurate for tiny angles, arccos of the dot product doesn't
+    difference = multiply(conjugate(a), b)
+    return 2 * np.arctan2(np.linalg.norm(difference[..., 1:], axis=-1), np.abs(difference[..., 0]))
@@ -17,7 +17,7 @@ class Vector:
         if item in self.value_order:
             return self.values[self.value_order.index(item)]
         else:
-            return self.__dict__[item]
+            raise AttributeError(item)
 
     def __setattr__(self, key, value):
         if key in self.value_order:
@@ -97,14 +97,11 @@ class Vector3H(Vector3F):
 
 
 class Vector3HF(Vector3F):
-    value_type = 'x'
-
-    def from_file(self, reader: ByteIO):
-        self._values = [reader.read_float16() for _ in range(self.size)]
+    value_type = 'e'
 
     def to_file(self, writer: ByteIO):
-        for v in self._values:
-            writer.write_float16(v)
+        with np.errstate(over='ignore'):
+            writer.write_array(self._values, np.float16)
 
 
 class Vector4F(Vector):
@@ -116,6 +113,13 @@ class Vector4F(Vector):
         self._values = list(reader.read_fmt(self.value_type * self.size))
 
 
+def vector_array(values, width):
+    """Array or sequence of vectors or plain values to a contiguous (n,width) float32 array"""
+    if not isinstance(values, np.ndarray):
+        values = [getattr(value, 'values', value) for value in values]
+    return np.ascontiguousarray(values, np.float32).reshape(-1, width)
+
+
 if __name__ == '__main__':
     # TESTING STUFF
     assert Vector2F(1, 2) == Vector2F([1, 2])
@@ -29,14 +29,6 @@ class Output(PragmaBase):
 
 
 class Entity(PragmaBase):
-    global_map_index = 1
-
-    @classmethod
-    def next_map_index(cls):
-        val = cls.global_map_index
-        cls.global_map_index += 1
-        return val
-
     def __init__(self):
         self.flags = EntityFlags(0)
         self.map_index = 0
@@ -59,12 +51,13 @@ class Entity(PragmaBase):
 
         if flag_mask != 0 and self.flags & flag_mask == 0:
             return
-        self.map_index = self.next_map_index()
-        self.class_name = reader.read_ascii_string()
+        if reader.context is not None:
+            self.map_index = reader.context.next_map_index()
+        self.class_name = reader.read_ascii_string(intern=True)
         self.origin.from_file(reader)
 
         for _ in range(reader.read_uint32()):
-            key = reader.read_ascii_string()
+            key = reader.read_ascii_string(intern=True)
             self.kv[key] = reader.read_ascii_string()
 
         for _ in range(reader.read_uint32()):
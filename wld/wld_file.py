@@ -2,7 +2,7 @@ from enum import IntFlag, IntFlag
 from typing import List
 
 from ..byte_io_wmd import ByteIO
-from ..shared import PragmaBase
+from ..shared import PragmaBase, ParseContext
 from .modules import BSPTree, Entity
 
 MAX_SUPPORTED_VERSION = 11
@@ -38,7 +38,6 @@ class World(PragmaBase):
             writer.write_uint64(self.face_vertex_data_offset)
 
     def __init__(self):
-        PragmaBase.set_base(self)
         self.version = 0
         self.flags = DataFlags(0)
         self.offsets = self.Offsets()
@@ -47,22 +46,30 @@ class World(PragmaBase):
         self.entities = []  # type:List[Entity]
 
     def from_file(self, reader: ByteIO):
-        reader.read_ascii_string(3)
-        self.version = reader.read_int32()
-        self.flags = DataFlags(reader.read_int64())
-        self.offsets.from_file(reader)
+        with reader.profile('header'):
+            reader.read_ascii_string(3)
+            self.version = reader.read_int32()
+            self.flags = DataFlags(reader.read_int64())
+            self.offsets.from_file(reader)
+        reader.context = ParseContext(self, self.version)
         reader.seek(self.offsets.materials_offset)
-        for _ in range(reader.read_uint32()):
-            self.materials.append(reader.read_ascii_string())
+        with reader.profile('materials') as section:
+            for _ in range(reader.read_uint32()):
+                self.materials.append(reader.read_ascii_string())
+            section.count = len(self.materials)
         reader.seek(self.offsets.bsp_tree_offset)
         if self.flags.HasBSPTree:
-            self.bsp_tree.from_file(reader)
+            with reader.profile('bsp') as section:
+                self.bsp_tree.from_file(reader)
+                section.count = len(self.bsp_tree.nodes)
             pass
         reader.seek(self.offsets.entities_offset)
-        for _ in range(reader.read_uint32()):
-            entity = Entity()
-            entity.from_file(reader, 0)
-            self.entities.append(entity)
+        with reader.profile('entities') as section:
+            for _ in range(reader.read_uint32()):
+                entity = Entity()
+                entity.from_file(reader, 0)
+                self.entities.append(entity)
+            section.count = len(self.entities)
 
     @staticmethod
     def check_header(reader: ByteIO):
@@ -1,2 +1,2 @@
 from .modules import *
-from .wmd_file import Model, MAX_SUPPORTED_VERSION, ModelFlags
+from .wmd_file import Model, MAX_SUPPORTED_VERSION, ModelFlags, ModelScan, SECTIONS, scan_directory
@@ -16,9 +16,18 @@ from .collision import CollisionMesh, CollisionMeshInfo, SoftBodyInfo
 
 from .animations.armature_animation import ArmatureAnimation, \
     ArmatureAnimationFrame, \
+    ArmatureAnimationFrames, \
     BlendController, \
     ArmatureAnimationsFlags
 
+from .animations.sampler import AnimationSampler
+
+from .animations.compression import CompressedAnimation, CompressionReport
+
+from .skinning import skin, skin_animation, skin_chunks
+
+from .animations.bounds import animation_bounds, bake_animation_bounds
+
 from .animations.vertex_animation import VertexMeshAnimationFrameFlags, \
     VertexMeshAnimation, \
     FlexInfo, \
@@ -13,68 +13,66 @@ class AnimationInfo(PragmaBase):
         self.phonemes = []  # type:List[Phoneme]
 
     def from_file(self, reader: ByteIO):
-        armature_animation_count = reader.read_uint32()
-        for _ in range(armature_animation_count):
-            arm_anim = ArmatureAnimation()
-            arm_anim.from_file(reader)
-            self.armature_animations.append(arm_anim)
-        if self.base.version >= 21:
-            vertex_anim_count = reader.read_uint32()
-            for _ in range(vertex_anim_count):
-                vert_anim = VertexAnimation()
-                vert_anim.from_file(reader)
-                self.vertex_animations.append(vert_anim)
-
-            for _ in range(reader.read_uint32()):
-                self.flex_controllers.append((reader.read_ascii_string(), reader.read_float(), reader.read_float()))
-
-            for _ in range(reader.read_uint32()):
-                flex_info = FlexInfo()
-                flex_info.from_file(reader)
-                self.flex_infos.append(flex_info)
-
-            for _ in range(reader.read_uint32()):
-                phoneme = Phoneme()
-                phoneme.from_file(reader)
-                self.phonemes.append(phoneme)
+        with reader.profile('armature_animations') as section:
+            armature_animation_count = reader.read_uint32()
+            for _ in range(armature_animation_count):
+                arm_anim = ArmatureAnimation()
+                arm_anim.from_file(reader)
+                self.armature_animations.append(arm_anim)
+            section.count = armature_animation_count
+        if reader.context.version >= 21:
+            with reader.profile('vertex_animations') as section:
+                vertex_anim_count = reader.read_uint32()
+                for _ in range(vertex_anim_count):
+                    vert_anim = VertexAnimation()
+                    vert_anim.from_file(reader)
+                    self.vertex_animations.append(vert_anim)
+                section.count = vertex_anim_count
+
+            with reader.profile('flex_controllers') as section:
+                for _ in range(reader.read_uint32()):
+                    self.flex_controllers.append((reader.read_ascii_string(), reader.read_float(), reader.read_float()))
+                section.count = len(self.flex_controllers)
+
+            with reader.profile('flexes') as section:
+                for _ in range(reader.read_uint32()):
+                    flex_info = FlexInfo()
+                    flex_info.from_file(reader)
+                    self.flex_infos.append(flex_info)
+                section.count = len(self.flex_infos)
+
+            with reader.profile('phonemes') as section:
+                for _ in range(reader.read_uint32()):
+                    phoneme = Phoneme()
+                    phoneme.from_file(reader)
+                    self.phonemes.append(phoneme)
+                section.count = len(self.phonemes)
 
     def to_file(self, writer: ByteIO):
         writer.write_uint32(len(self.armature_animations))
         for arm_anim in self.armature_animations:
             arm_anim.to_file(writer)
 
-        vert_anim_offset = writer.tell()
-        with writer.save_current_pos():
-            writer.seek(self.base.skinned_data_offset + 16)
-            writer.write_uint64(vert_anim_offset)
+        writer.mark_offset('vertex_animations')
 
         writer.write_uint32(len(self.vertex_animations))
         for vert_anim in self.vertex_animations:
             vert_anim.to_file(writer)
 
-        flex_controllers_offset = writer.tell()
-        with writer.save_current_pos():
-            writer.seek(self.base.skinned_data_offset + 24)
-            writer.write_uint64(flex_controllers_offset)
+        writer.mark_offset('flex_controllers')
 
         writer.write_uint32(len(self.flex_controllers))
         for flex, a, b in self.flex_controllers:
             writer.write_ascii_string(flex)
             writer.write_fmt('ff', a, b)
 
-        flex_infos_offset = writer.tell()
-        with writer.save_current_pos():
-            writer.seek(self.base.skinned_data_offset + 32)
-            writer.write_uint64(flex_infos_offset)
+        writer.mark_offset('flexes')
 
         writer.write_uint32(len(self.flex_infos))
         for info in self.flex_infos:
             info.to_file(writer)
 
-        phonemes_offset = writer.tell()
-        with writer.save_current_pos():
-            writer.seek(self.base.skinned_data_offset + 40)
-            writer.write_uint64(phonemes_offset)
+        writer.mark_offset('phoneme_map')
 
         writer.write_uint32(len(self.phonemes))
         for phoneme in self.phonemes:
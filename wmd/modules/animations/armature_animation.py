@@ -1,7 +1,11 @@
+from collections.abc import Sequence
 from enum import IntFlag
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 
-from .. import PragmaBase, Vector2F, Vector3F, Vector4F
+import numpy as np
+
+from .. import PragmaBase, Vector2F, Vector3F, Vector4F, vector_array
+from .compression import CompressedAnimation, CompressionReport
 from ....byte_io_wmd import ByteIO
 
 
@@ -34,47 +38,107 @@ class ArmatureAnimationsFlags(IntFlag):
     NoMoveBlend = 512
 
 
+# frames read ahead after a frame with events, see ArmatureAnimation._read_frames
+_FIRST_FRAME_CHUNK = 16
+
+
 class ArmatureAnimationFrame(PragmaBase):
+    """
+    Frames returned by ArmatureAnimation.frames are views into the animation arrays,
+    pos and rot are (bones,3) and (bones,4) array views, move is a Vector2F over the [x,z] row of moves.
+    Frames created by hand keep their own data until they're assigned to ArmatureAnimation.frames.
+    """
+
+    def __init__(self, anim: 'ArmatureAnimation', index=None):
+        self._anim = anim
+        self._index = index
+        if index is None:
+            self._pos = []  # type:List[Vector3F]
+            self._rot = []  # type:List[Vector4F]
+            self._events = {}  # type: Dict[str,List[str]]
+            self._move = Vector2F([0.0, 0.0])
+
+    @property
+    def pos(self):
+        if self._index is None:
+            return self._pos
+        return self._anim.positions[self._index]
+
+    @pos.setter
+    def pos(self, values):
+        if self._index is None:
+            self._pos = values
+        else:
+            self._anim.positions[self._index] = vector_array(values, 3)
+
+    @property
+    def rot(self):
+        if self._index is None:
+            return self._rot
+        return self._anim.rotations[self._index]
+
+    @rot.setter
+    def rot(self, values):
+        if self._index is None:
+            self._rot = values
+        else:
+            self._anim.rotations[self._index] = vector_array(values, 4)
+
+    @property
+    def events(self):
+        if self._index is None:
+            return self._events
+        return self._anim.events.setdefault(self._index, {})
+
+    @events.setter
+    def events(self, events):
+        if self._index is None:
+            self._events = events
+        else:
+            self._anim.events[self._index] = events
+
+    @property
+    def move(self):
+        if self._index is None:
+            return self._move
+        move = Vector2F()
+        move._values = self._anim.frame_moves()[self._index]
+        return move
+
+    @move.setter
+    def move(self, move):
+        if self._index is None:
+            self._move = move
+        else:
+            self._anim.frame_moves()[self._index] = getattr(move, 'values', move)
+
+
+class ArmatureAnimationFrames(Sequence):
+    """
+    Frame views returned by ArmatureAnimation.frames.
+    Frames are packed into the animation arrays, so the sequence itself can't be modified:
+    build a list of frames and assign it to ArmatureAnimation.frames instead.
+    """
+
     def __init__(self, anim: 'ArmatureAnimation'):
         self._anim = anim
-        self.pos = []  # type:List[Vector3F]
-        self.rot = []  # type:List[Vector4F]
-        self.events = {}  # type: Dict[str,List[str]]
-        self.move = Vector2F()
 
-    def from_file(self, reader: ByteIO):
-        for _ in self._anim.bones:
-            pos = Vector3F()
-            pos.from_file(reader)
-            quat = Vector4F()
-            quat.from_file(reader)
-            self.pos.append(pos)
-            self.rot.append(quat)
-        for _ in range(reader.read_uint16()):
-            name = reader.read_ascii_string()
-            params = []
-            for _ in range(reader.read_uint8()):
-                params.append(reader.read_ascii_string())
-            self.events[name] = params
-        if self._anim.flags & ArmatureAnimationsFlags.MoveX:
-            self.move.x = reader.read_float()
-        if self._anim.flags & ArmatureAnimationsFlags.MoveZ:
-            self.move.z = reader.read_float()
+    def __len__(self):
+        return self._anim.frame_count
 
-    def to_file(self, writer: ByteIO):
-        for bone_id in range(len(self._anim.bones)):
-            self.pos[bone_id].to_file(writer)
-            self.rot[bone_id].to_file(writer)
-        writer.write_uint16(len(self.events))
-        for event_name, params in self.events.items():
-            writer.write_ascii_string(event_name)
-            writer.write_uint8(len(params))
-            for param in params:
-                writer.write_ascii_string(param)
-        if self._anim.flags & ArmatureAnimationsFlags.MoveX:
-            writer.write_float(self.move.x)
-        if self._anim.flags & ArmatureAnimationsFlags.MoveZ:
-            writer.write_float(self.move.z)
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+        return ArmatureAnimationFrame(self._anim, index)
+
+    def _read_only(self, *args):
+        raise TypeError("ArmatureAnimation.frames can't be modified in place, assign a list of frames to it")
+
+    append = extend = insert = remove = pop = clear = __setitem__ = __delitem__ = __iadd__ = _read_only
 
 
 class ArmatureAnimation(PragmaBase):
@@ -97,7 +161,175 @@ class ArmatureAnimation(PragmaBase):
         self.animation_post_blend_controller = -1
         self.animation_post_blend_target = -1
 
-        self.frames = []  # type: List[ArmatureAnimationFrame]
+        self.compressed = None  # type: Optional[CompressedAnimation]
+        self._positions = np.zeros((0, 0, 3), np.float32)
+        self._rotations = np.zeros((0, 0, 4), np.float32)  # w,x,y,z
+        self.events = {}  # type: Dict[int,Dict[str,List[str]]] # frame -> event name -> params
+        self.moves = np.zeros((0, 2), np.float32)  # x,z per frame, written only with MoveX/MoveZ flags
+
+    @property
+    def positions(self):
+        """(frames,bones,3), expands compressed animations"""
+        self.decompress()
+        return self._positions
+
+    @positions.setter
+    def positions(self, positions):
+        self.decompress()
+        self._positions = positions
+
+    @property
+    def rotations(self):
+        """(frames,bones,4) w,x,y,z, expands compressed animations"""
+        self.decompress()
+        return self._rotations
+
+    @rotations.setter
+    def rotations(self, rotations):
+        self.decompress()
+        self._rotations = rotations
+
+    @property
+    def frame_count(self):
+        if self.compressed is not None:
+            return self.compressed.frame_count
+        return len(self._positions)
+
+    def frame_moves(self):
+        """moves with a row for every frame, animations without move data get zero rows"""
+        if len(self.moves) != self.frame_count:
+            if len(self.moves):
+                raise ValueError(f"Animation has {self.frame_count} frames but {len(self.moves)} moves")
+            self.moves = np.zeros((self.frame_count, 2), np.float32)
+        return self.moves
+
+    def frame_arrays(self):
+        """Positions and rotations of every frame, compressed animations are expanded without being modified"""
+        if self.compressed is not None:
+            return self.compressed.decompress()
+        return self._positions, self._rotations
+
+    def compress(self, position_tolerance=1e-4, angle_tolerance=1e-3) -> CompressionReport:
+        """
+        Replaces positions and rotations with a key frame reduced, quantized CompressedAnimation.
+        Accessing positions, rotations or frames expands it again, to_file and sampling don't.
+        :return: errors and sizes of the compressed frames
+        """
+        positions, rotations = self.frame_arrays()
+        self.compressed = CompressedAnimation(positions, rotations, position_tolerance, angle_tolerance)
+        self._positions = self._rotations = None
+        return self.compressed.report
+
+    def decompress(self):
+        if self.compressed is not None:
+            self._positions, self._rotations = self.compressed.decompress()
+            self.compressed = None
+
+    @property
+    def frames(self):
+        """Per frame views of the animation, assign a list of frames to replace all of them"""
+        return ArmatureAnimationFrames(self)
+
+    @frames.setter
+    def frames(self, frames: List[ArmatureAnimationFrame]):
+        frame_count = len(frames)
+        bone_count = len(frames[0].pos) if frames else len(self.bones)
+        positions = np.empty((frame_count, bone_count, 3), np.float32)
+        rotations = np.empty((frame_count, bone_count, 4), np.float32)
+        moves = np.zeros((frame_count, 2), np.float32)
+        events = {}
+        for index, frame in enumerate(frames):
+            positions[index] = vector_array(frame.pos, 3)
+            rotations[index] = vector_array(frame.rot, 4)
+            move = getattr(frame.move, 'values', frame.move)
+            moves[index] = move if len(move) else 0.0
+            if frame.events:
+                events[index] = frame.events
+        self.positions, self.rotations, self.moves, self.events = positions, rotations, moves, events
+
+    @property
+    def _move_columns(self):
+        columns = []
+        if self.flags & ArmatureAnimationsFlags.MoveX:
+            columns.append(0)
+        if self.flags & ArmatureAnimationsFlags.MoveZ:
+            columns.append(1)
+        return columns
+
+    def _frame_dtype(self):
+        """Layout of a frame without events"""
+        return np.dtype([('transforms', np.float32, (len(self.bones), 7)),
+                         ('event_count', np.uint16),
+                         ('move', np.float32, (len(self._move_columns),))])
+
+    def _read_frames(self, reader: ByteIO, frame_count):
+        bone_count = len(self.bones)
+        move_columns = self._move_columns
+        frame_dtype = self._frame_dtype()
+        transforms = np.empty((frame_count, bone_count, 7), np.float32)
+        self.moves = np.zeros((frame_count, 2), np.float32)
+        self.events = {}
+        end = reader.size()
+        frame = 0
+        # frames without events have a fixed size and are read in bulk up to the next frame with events.
+        # Runs are read in chunks that start small after every event and double while none is found,
+        # so frames read past an event and rewound stay proportional to the frames actually used
+        chunk = _FIRST_FRAME_CHUNK
+        while frame < frame_count:
+            while frame < frame_count:
+                count = min(frame_count - frame, chunk, (end - reader.tell()) // frame_dtype.itemsize)
+                if not count:
+                    break
+                records = reader.read_array(frame_dtype, count)
+                with_events = np.flatnonzero(records['event_count'])
+                if with_events.size:
+                    reader.rewind((count - with_events[0]) * frame_dtype.itemsize)
+                    count = int(with_events[0])
+                    records = records[:count]
+                transforms[frame:frame + count] = records['transforms']
+                self.moves[frame:frame + count, move_columns] = records['move']
+                frame += count
+                if with_events.size:
+                    break
+                chunk *= 2
+            if frame == frame_count:
+                break
+            chunk = _FIRST_FRAME_CHUNK
+
+            transforms[frame] = reader.read_array(np.float32, bone_count * 7).reshape(bone_count, 7)
+            events = self.events[frame] = {}
+            for _ in range(reader.read_uint16()):
+                name = reader.read_ascii_string()
+                params = []
+                for _ in range(reader.read_uint8()):
+                    params.append(reader.read_ascii_string())
+                events[name] = params
+            self.moves[frame, move_columns] = reader.read_array(np.float32, len(move_columns))
+            frame += 1
+        self.positions = np.ascontiguousarray(transforms[:, :, :3])
+        self.rotations = np.ascontiguousarray(transforms[:, :, 3:])
+
+    def _write_frames(self, writer: ByteIO):
+        move_columns = self._move_columns
+        positions, rotations = self.frame_arrays()
+        records = np.zeros(len(positions), self._frame_dtype())
+        records['transforms'][:, :, :3] = positions
+        records['transforms'][:, :, 3:] = rotations
+        records['move'] = self.frame_moves()[:, move_columns]
+        frame = 0
+        for event_frame in sorted(index for index, events in self.events.items() if events):
+            writer.write_array(records[frame:event_frame])
+            writer.write_array(records['transforms'][event_frame])
+            events = self.events[event_frame]
+            writer.write_uint16(len(events))
+            for event_name, params in events.items():
+                writer.write_ascii_string(event_name)
+                writer.write_uint8(len(params))
+                for param in params:
+                    writer.write_ascii_string(param)
+            writer.write_array(records['move'][event_frame])
+            frame = event_frame + 1
+        writer.write_array(records[frame:])
 
     def from_file(self, reader: ByteIO):
         self.name = reader.read_ascii_string()
@@ -114,28 +346,23 @@ class ArmatureAnimation(PragmaBase):
         if self.fade_out:
             self.fade_out_time = reader.read_float()
 
-        for _ in range(reader.read_uint32()):
-            self.bones.append(reader.read_uint32())
+        self.bones = reader.read_array(np.uint32, reader.read_uint32()).tolist()
 
         if reader.read_uint8() == 1:
-            for _ in range(len(self.bones)):
-                self.weights.append(reader.read_float())
+            self.weights = reader.read_array(np.float32, len(self.bones)).tolist()
 
         if reader.read_uint8() == 1:
-            self.controller = self.base.blend_controllers[reader.read_uint32()]
+            self.controller = reader.context.blend_controllers[reader.read_uint32()]
             for _ in range(reader.read_uint32()):
-                if self.base.version >= 29:
+                if reader.context.version >= 29:
                     self.transitions.append(reader.read_float())
                 else:
                     self.transitions.append(reader.read_fmt('Ii'))
-            if self.base.version >= 29:
+            if reader.context.version >= 29:
                 self.animation_post_blend_controller = reader.read_int32()
                 self.animation_post_blend_target = reader.read_int32()
 
-        for _ in range(reader.read_uint32()):
-            frame = ArmatureAnimationFrame(self)
-            frame.from_file(reader)
-            self.frames.append(frame)
+        self._read_frames(reader, reader.read_uint32())
 
     def to_file(self, writer: ByteIO):
         writer.write_ascii_string(self.name)
@@ -157,27 +384,33 @@ class ArmatureAnimation(PragmaBase):
             writer.write_float(self.fade_out_time)
 
         writer.write_uint32(len(self.bones))
-        for w in self.bones:
-            writer.write_uint32(w)
+        writer.write_array(self.bones, np.uint32)
 
         writer.write_int8(len(self.weights) > 0)
         if self.weights:
-            writer.write_uint32(len(self.weights))
-            for w in self.weights:
-                writer.write_float(w)
+            writer.write_array(self.weights, np.float32)
 
         writer.write_uint8(self.controller.name != '')
         if self.controller.name != '':
-            writer.write_uint32(self.base.blend_controllers.index(self.controller))
+            if writer.context is None:
+                raise ValueError("Writing a blend controller reference needs the model, save it with Model.to_file")
+            writer.write_uint32(writer.context.index(writer.context.blend_controllers, self.controller))
             writer.write_uint32(len(self.transitions))
             for t in self.transitions:
                 writer.write_float(t)
             writer.write_int32(self.animation_post_blend_controller)
             writer.write_int32(self.animation_post_blend_target)
 
-        writer.write_uint32(len(self.frames))
-        for frame in self.frames:
-            frame.to_file(writer)
+        writer.write_uint32(self.frame_count)
+        self._write_frames(writer)
+
+    def sample(self, times, armature=None):
+        """
+        Interpolated local poses at times in seconds, returns positions and rotations arrays.
+        Packs the frames on every call, use an AnimationSampler to sample the same animations repeatedly.
+        """
+        from .sampler import AnimationSampler
+        return AnimationSampler([self], armature).sample(0, times)
 
     @property
     def has_movement(self):
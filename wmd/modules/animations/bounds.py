@@ -0,0 +1,65 @@
+from typing import List
+
+import numpy as np
+
+from .. import Vector3F
+from .armature_animation import ArmatureAnimation
+from .sampler import AnimationSampler
+from ..armature import Armature, transform_matrices
+from ..hitbox import HitBox
+from ..mesh import SubMesh
+from ..skinning import skin_chunks
+from ....shared.modules import quaternion
+
+# corner selectors of a box, 0 picks min and 1 picks max of every axis
+_BOX_CORNERS = np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)], bool)
+
+
+def animation_bounds(animations: List[ArmatureAnimation], armature: Armature,
+                     sub_meshes: List[SubMesh] = (), hitboxes: List[HitBox] = ()) -> List[np.ndarray]:
+    """
+    Per frame bounds of every animation, from the skinned vertices of sub_meshes and the corners of hitboxes.
+    All frames of all animations are posed and measured together.
+    :return: (frames,2,3) min and max of every frame of every animation
+    """
+    if not len(sub_meshes) and not len(hitboxes):
+        raise ValueError("Bounds need sub meshes or hitboxes to measure")
+    sampler = AnimationSampler(animations, armature)
+    world_positions, world_rotations = armature.world_transforms(sampler.positions, sampler.rotations)
+    frame_count = len(world_positions)
+    mins = np.full((frame_count, 3), np.inf, np.float32)
+    maxs = np.full((frame_count, 3), -np.inf, np.float32)
+
+    if len(hitboxes):
+        bones = np.array([armature.bone_index(hitbox.bone) for hitbox in hitboxes], np.int64)
+        extents = np.array([(hitbox.min.values, hitbox.max.values) for hitbox in hitboxes], np.float32)
+        corners = np.where(_BOX_CORNERS, extents[:, 1, None], extents[:, 0, None])  # (hitboxes,8,3)
+        world_corners = (world_positions[:, bones, None] +
+                         quaternion.rotate(world_rotations[:, bones, None], corners))
+        mins = np.minimum(mins, world_corners.min(axis=(1, 2)))
+        maxs = np.maximum(maxs, world_corners.max(axis=(1, 2)))
+
+    if len(sub_meshes):
+        world_matrices = transform_matrices(world_positions, world_rotations)
+        inverse_bind_matrices = armature.inverse_bind_matrices()
+        for sub_mesh in sub_meshes:
+            for _, positions, _ in skin_chunks(sub_mesh, armature, world_matrices, inverse_bind_matrices,
+                                               normals=False):
+                np.minimum(mins, positions.min(axis=0), out=mins)
+                np.maximum(maxs, positions.max(axis=0), out=maxs)
+
+    return np.split(np.stack((mins, maxs), axis=1), sampler.offsets[1:])
+
+
+def bake_animation_bounds(animations: List[ArmatureAnimation], armature: Armature,
+                          sub_meshes: List[SubMesh] = (), hitboxes: List[HitBox] = ()) -> List[np.ndarray]:
+    """
+    Recomputes min and max of every animation with animation_bounds, animations without frames are left as is.
+    :return: the per frame bounds
+    """
+    frame_bounds = animation_bounds(animations, armature, sub_meshes, hitboxes)
+    for anim, bounds in zip(animations, frame_bounds):
+        if len(bounds):
+            anim.min = Vector3F(bounds[:, 0].min(axis=0).tolist())
+            anim.max = Vector3F(bounds[:, 1].max(axis=0).tolist())
+    return frame_bounds
@@ -0,0 +1,206 @@
+"""
+Compact in-memory form of armature animation frames.
+Every bone track keeps only the key frames needed to stay within an error tolerance,
+positions are linearly and rotations spherically interpolated between them.
+Rotation keys are quantized with the smallest three encoding into three uint16 per key.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from ....shared.modules import quaternion
+
+# the three smallest components of a unit quaternion are within +-1/sqrt(2)
+_QUANTIZED_RANGE = np.float32(1 / np.sqrt(2))
+_QUANTIZED_STEPS = (1 << 15) - 1
+# indices of the stored components for every index of the dropped largest one
+_SMALLEST_THREE = np.array([[j for j in range(4) if j != i] for i in range(4)], np.int64)
+
+
+def quantize_rotations(rotations):
+    """(...,4) unit quaternions to (...,3) uint16, 15 bits per component, the dropped index in the top bits"""
+    rotations = quaternion.normalize(np.asarray(rotations, np.float32))
+    largest = np.argmax(np.abs(rotations), axis=-1)
+    # q and -q are the same rotation, store the one with a positive largest component
+    rotations = np.where(np.take_along_axis(rotations, largest[..., None], -1) < 0, -rotations, rotations)
+    components = np.take_along_axis(rotations, _SMALLEST_THREE[largest], -1)
+    scaled = (np.clip(components / _QUANTIZED_RANGE, -1, 1) + 1) * (_QUANTIZED_STEPS / 2)
+    packed = np.rint(scaled).astype(np.uint16)
+    packed[..., 0] |= ((largest & 1) << 15).astype(np.uint16)
+    packed[..., 1] |= ((largest >> 1) << 15).astype(np.uint16)
+    return packed
+
+
+def dequantize_rotations(packed):
+    """(...,3) uint16 from quantize_rotations back to (...,4) unit quaternions"""
+    packed = np.asarray(packed, np.uint16)
+    largest = ((packed[..., 0] >> 15) | ((packed[..., 1] >> 15) << 1)).astype(np.int64)
+    components = (packed & 0x7FFF).astype(np.float32) * np.float32(2 / _QUANTIZED_STEPS) - 1
+    components *= _QUANTIZED_RANGE
+    rotations = np.empty(packed.shape[:-1] + (4,), np.float32)
+    np.put_along_axis(rotations, _SMALLEST_THREE[largest], components, -1)
+    np.put_along_axis(rotations, largest[..., None],
+                      np.sqrt(np.maximum(1 - np.sum(components * components, -1, keepdims=True), 0)), -1)
+    return rotations
+
+
+def _key_spans(keys):
+    """Previous and next key frame of every frame of every track and the factor between them"""
+    frame_count = len(keys)
+    frames = np.arange(frame_count, dtype=np.int32)[:, None]
+    previous = np.maximum.accumulate(np.where(keys, frames, 0), axis=0)
+    following = np.minimum.accumulate(np.where(keys, frames, frame_count)[::-1], axis=0)[::-1]
+    # tracks hold their last key
+    following = np.where(following == frame_count, previous, following)
+    span = following - previous
+    factors = np.where(span > 0, (frames - previous) / np.maximum(span, 1), 0).astype(np.float32)
+    return previous, following, factors
+
+
+def _lerp(a, b, factors):
+    factors = factors[..., None]
+    return a * (1 - factors) + b * factors
+
+
+def _position_error(a, b):
+    return np.linalg.norm(a - b, axis=-1)
+
+
+def _reduce_keys(values, key_values, tolerance, interpolate, error):
+    """
+    Key frames of every track, (frames,tracks) bool.
+    Tracks start with their first and last frame, or only the first if they're constant,
+    then the worst frame of every run of frames over tolerance becomes a key until no frame is.
+    :param values: (frames,tracks,n) frames to reproduce
+    :param key_values: values the way they're stored as keys
+    """
+    frame_count, track_count = values.shape[:2]
+    keys = np.zeros((frame_count, track_count), bool)
+    keys[0] = True
+    constant = np.all(error(key_values[:1], values) <= tolerance, axis=0)
+    keys[-1] |= ~constant
+    errors = np.zeros((frame_count, track_count), np.float32)
+    # errors only change in spans split by the previous pass
+    changed = np.broadcast_to(~constant, keys.shape)
+    previous = following = None
+    while True:
+        spans = _key_spans(keys)
+        if previous is not None:
+            changed = (spans[0] != previous) | (spans[1] != following)
+        previous, following, factors = spans
+        frames, tracks = np.nonzero(changed)
+        errors[frames, tracks] = error(interpolate(key_values[previous[frames, tracks], tracks],
+                                                   key_values[following[frames, tracks], tracks],
+                                                   factors[frames, tracks]),
+                                       values[frames, tracks])
+        tracks, frames = np.nonzero(((errors > tolerance) & ~keys).T)
+        if not frames.size:
+            return keys
+        # the worst frame of every run of frames over tolerance becomes a key
+        spans = previous[frames, tracks]
+        runs = np.ones(len(frames), bool)
+        runs[1:] = (tracks[1:] != tracks[:-1]) | (spans[1:] != spans[:-1]) | (frames[1:] != frames[:-1] + 1)
+        runs = np.cumsum(runs)
+        order = np.lexsort((-errors[frames, tracks], runs))
+        worst = order[np.concatenate(([True], runs[order][1:] != runs[order][:-1]))]
+        keys[frames[worst], tracks[worst]] = True
+
+
+def _expand(key_values, keys, interpolate):
+    previous, following, factors = _key_spans(keys)
+    tracks = np.arange(keys.shape[1])
+    return interpolate(key_values[previous, tracks], key_values[following, tracks], factors)
+
+
+class CompressionReport(NamedTuple):
+    position_error: float  # largest distance of a decompressed position from the source frames
+    angle_error: float  # largest angle in radians between a decompressed and source rotation
+    constant_tracks: int
+    linear_tracks: int  # tracks with only their first and last key
+    keyed_tracks: int
+    key_count: int
+    raw_bytes: int
+    compressed_bytes: int
+
+    @property
+    def ratio(self):
+        return self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0
+
+
+class _Tracks:
+    """Key frames of every bone, track-major: keys of bone i are offsets[i]:offsets[i+1]"""
+
+    def __init__(self, keys, values):
+        tracks, frames = np.nonzero(keys.T)
+        self.offsets = np.concatenate(([0], np.cumsum(keys.sum(axis=0)))).astype(np.uint32)
+        self.frames = frames.astype(np.min_scalar_type(max(len(keys) - 1, 0)))
+        self.values = np.ascontiguousarray(values[frames, tracks])
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.frames.nbytes + self.values.nbytes
+
+    def key_counts(self):
+        return np.diff(self.offsets)
+
+    def dense(self, frame_count, values):
+        """Key frame mask and key values placed at their frames"""
+        track_count = len(self.offsets) - 1
+        tracks = np.repeat(np.arange(track_count), self.key_counts())
+        keys = np.zeros((frame_count, track_count), bool)
+        keys[self.frames, tracks] = True
+        key_values = np.zeros((frame_count, track_count, values.shape[-1]), np.float32)
+        key_values[self.frames, tracks] = values
+        return keys, key_values
+
+
+class CompressedAnimation:
+    """Key frame reduced, quantized positions and rotations of an animation"""
+
+    def __init__(self, positions, rotations, position_tolerance=1e-4, angle_tolerance=1e-3):
+        """
+        :param positions: (frames,bones,3) positions
+        :param rotations: (frames,bones,4) w,x,y,z rotations
+        :param position_tolerance: largest distance a decompressed position may be off by
+        :param angle_tolerance: largest rotation in radians a decompressed rotation may be off by,
+        quantization alone is off by up to about 1e-4
+        """
+        positions = np.asarray(positions, np.float32)
+        rotations = np.asarray(rotations, np.float32)
+        self.frame_count, self.bone_count = positions.shape[:2]
+        quantized = quantize_rotations(rotations)
+        if self.frame_count:
+            position_keys = _reduce_keys(positions, positions, position_tolerance, _lerp, _position_error)
+            rotation_keys = _reduce_keys(rotations, dequantize_rotations(quantized), angle_tolerance,
+                                         quaternion.slerp, quaternion.angle_between)
+        else:
+            position_keys = rotation_keys = np.zeros((0, self.bone_count), bool)
+        self.positions = _Tracks(position_keys, positions)
+        self.rotations = _Tracks(rotation_keys, quantized)
+
+        decompressed_positions, decompressed_rotations = self.decompress()
+        key_counts = np.concatenate((self.positions.key_counts(), self.rotations.key_counts()))
+        self.report = CompressionReport(
+            float(_position_error(decompressed_positions, positions).max(initial=0)),
+            float(quaternion.angle_between(decompressed_rotations, rotations).max(initial=0)),
+            int(np.count_nonzero(key_counts == 1)),
+            int(np.count_nonzero(key_counts == 2)),
+            int(np.count_nonzero(key_counts > 2)),
+            int(key_counts.sum()),
+            positions.nbytes + rotations.nbytes,
+            self.nbytes)
+
+    @property
+    def nbytes(self):
+        return self.positions.nbytes + self.rotations.nbytes
+
+    def decompress(self):
+        """Full (frames,bones,3) positions and (frames,bones,4) rotations"""
+        if not self.frame_count:
+            return (np.zeros((0, self.bone_count, 3), np.float32),
+                    np.zeros((0, self.bone_count, 4), np.float32))
+        keys, key_values = self.positions.dense(self.frame_count, self.positions.values)
+        positions = _expand(key_values, keys, _lerp).astype(np.float32)
+        keys, key_values = self.rotations.dense(self.frame_count, dequantize_rotations(self.rotations.values))
+        rotations = _expand(key_values, keys, quaternion.slerp).astype(np.float32)
+        return positions, rotations
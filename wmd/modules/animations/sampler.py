@@ -0,0 +1,102 @@
+from typing import List, Optional
+
+import numpy as np
+
+from .armature_animation import ArmatureAnimation, ArmatureAnimationsFlags
+from ..armature import Armature
+from ....shared.modules import quaternion
+
+
+class AnimationSampler:
+    """
+    Samples local poses of many animations at arbitrary times in one vectorized pass.
+    Frames of all animations are packed into one table when the sampler is created,
+    create a new sampler after editing the animations.
+
+    Looping animations (Loop without NoRepeat) wrap around, interpolating from the last frame back to the first,
+    others hold their first and last frame outside of their range.
+    """
+
+    def __init__(self, animations: List[ArmatureAnimation], armature: Optional[Armature] = None):
+        """
+        :param armature: sample poses of every bone of the armature, bones an animation doesn't animate
+        keep their rest pose. Without it poses are in animation channel order (anim.bones), padded with
+        zero positions and identity rotations to the largest channel count
+        """
+        self.animations = animations
+        if armature is not None:
+            bone_count = len(armature.bones)
+            rest_positions, rest_rotations = armature.rest_pose()
+        else:
+            bone_count = max((anim.frame_arrays()[0].shape[1] for anim in animations), default=0)
+            rest_positions = np.zeros((bone_count, 3), np.float32)
+            rest_rotations = np.tile(quaternion.IDENTITY, (bone_count, 1))
+
+        frame_counts = np.array([anim.frame_count for anim in animations], np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(frame_counts)[:-1])).astype(np.int64)
+        self.frame_counts = frame_counts
+        total = int(frame_counts.sum())
+        self.positions = np.empty((total, bone_count, 3), np.float32)
+        self.rotations = np.empty((total, bone_count, 4), np.float32)
+        self.positions[:] = rest_positions
+        self.rotations[:] = rest_rotations
+        for anim, offset in zip(animations, self.offsets):
+            positions, rotations = anim.frame_arrays()
+            frames = slice(offset, offset + anim.frame_count)
+            channels = np.asarray(anim.bones, np.int64) if armature is not None else slice(0, positions.shape[1])
+            self.positions[frames, channels] = positions
+            self.rotations[frames, channels] = rotations
+
+        self.fps = np.array([anim.fps for anim in animations], np.float64)
+        self.loop = np.array([bool(anim.flags & ArmatureAnimationsFlags.Loop) and
+                              not anim.flags & ArmatureAnimationsFlags.NoRepeat for anim in animations], bool)
+        self.fade_in = np.array([anim.fade_in_time if anim.fade_in else 0.0 for anim in animations], np.float64)
+        self.fade_out = np.array([anim.fade_out_time if anim.fade_out else 0.0 for anim in animations], np.float64)
+
+    @property
+    def durations(self):
+        """Seconds until the last frame, looping animations take one more frame to wrap around"""
+        frames = np.where(self.loop, self.frame_counts, np.maximum(self.frame_counts - 1, 0))
+        return frames / np.where(self.fps > 0, self.fps, 1)
+
+    def _frames(self, animation_ids, times):
+        counts = self.frame_counts[animation_ids]
+        if np.any(counts == 0):
+            raise ValueError("Can't sample an animation without frames")
+        position = np.maximum(times, 0) * self.fps[animation_ids]
+        loop = self.loop[animation_ids]
+        position = np.where(loop, np.mod(position, counts), np.minimum(position, counts - 1))
+        first = np.floor(position).astype(np.int64)
+        factor = position - first
+        second = np.where(loop, (first + 1) % counts, np.minimum(first + 1, counts - 1))
+        offsets = self.offsets[animation_ids]
+        return offsets + first, offsets + second, factor
+
+    def sample(self, animation_ids, times):
+        """
+        :param animation_ids: index into animations for every sample, broadcast against times
+        :param times: playback time in seconds since the animation started for every sample
+        :return: positions (...,bones,3) and w,x,y,z rotations (...,bones,4) of every sample
+        """
+        animation_ids, times = np.broadcast_arrays(np.asarray(animation_ids, np.int64), np.asarray(times, np.float64))
+        first, second, factor = self._frames(animation_ids, times)
+        factor = factor.astype(np.float32)[..., None]
+        positions = self.positions[first] * (1 - factor[..., None]) + self.positions[second] * factor[..., None]
+        rotations = quaternion.slerp(self.rotations[first], self.rotations[second], factor)
+        return positions, rotations
+
+    def weights(self, animation_ids, times):
+        """
+        Blend weight of every sample from the fade in and fade out times of its animation.
+        Looping animations only fade in, they never reach their end.
+        """
+        animation_ids, times = np.broadcast_arrays(np.asarray(animation_ids, np.int64), np.asarray(times, np.float64))
+        weights = np.ones(times.shape, np.float32)
+        fade_in = self.fade_in[animation_ids]
+        fading_in = fade_in > 0
+        weights[fading_in] = np.clip(times[fading_in] / fade_in[fading_in], 0, 1)
+        fade_out = self.fade_out[animation_ids]
+        fading_out = (fade_out > 0) & ~self.loop[animation_ids]
+        remaining = self.durations[animation_ids][fading_out] - times[fading_out]
+        weights[fading_out] *= np.clip(remaining / fade_out[fading_out], 0, 1)
+        return weights
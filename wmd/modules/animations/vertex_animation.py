@@ -1,7 +1,9 @@
 from enum import IntFlag
 from typing import List
 
-from .. import PragmaBase, SubMesh, Vector3HF
+import numpy as np
+
+from .. import PragmaBase, SubMesh
 from ....byte_io_wmd import ByteIO
 
 
@@ -10,12 +12,27 @@ class VertexMeshAnimationFrameFlags(IntFlag):
     HasDeltaValues = 1
 
 
+# in-memory frame layout, delta is 0 for frames without delta values
+VERTEX_FRAME_DTYPE = np.dtype([('index', np.uint16), ('position', np.float16, 3), ('delta', np.uint16)])
+# on-disk frame layout without delta values
+_VERTEX_FRAME_NO_DELTA_DTYPE = np.dtype([('index', np.uint16), ('position', np.float16, 3)])
+
+
+def _frame_array(frame):
+    """Accepts frames built from (index, position, delta) tuples, position may be a Vector3HF"""
+    if isinstance(frame, np.ndarray):
+        return frame.astype(VERTEX_FRAME_DTYPE, copy=False)
+    with np.errstate(over='ignore'):
+        return np.array([(idx, tuple(getattr(v, 'values', v)), delta) for idx, v, delta in frame],
+                        VERTEX_FRAME_DTYPE)
+
+
 class VertexMeshAnimation(PragmaBase):
     def __init__(self):
         self.meshgroup_id = 0
         self.mesh_id = 0
         self.submesh_id = 0
-        self.frames = []
+        self.frames = []  # type: List[np.ndarray] # VERTEX_FRAME_DTYPE records
         self.flags = []  # TODO: remove it
         self.target_submesh = SubMesh()
 
@@ -23,37 +40,37 @@ class VertexMeshAnimation(PragmaBase):
         self.meshgroup_id = reader.read_uint32()
         self.mesh_id = reader.read_uint32()
         self.submesh_id = reader.read_uint32()
-        self.target_submesh = self.base.mesh.mesh_groups[self.meshgroup_id].meshes[self.mesh_id][self.submesh_id]
+        self.target_submesh = reader.context.mesh.mesh_groups[self.meshgroup_id].meshes[self.mesh_id][self.submesh_id]
 
         for _ in range(reader.read_uint32()):
             flags = VertexMeshAnimationFrameFlags(0)
-            if self.base.version >= 25:
+            if reader.context.version >= 25:
                 flags = VertexMeshAnimationFrameFlags(reader.read_uint8())
             self.flags.append(flags)
-            verts = []
-            for _ in range(reader.read_uint16()):
-                idx = reader.read_uint16()
-                v = Vector3HF()
-                v.from_file(reader)
-                delta = 0
-                if flags & VertexMeshAnimationFrameFlags.HasDeltaValues:
-                    delta = reader.read_uint16()
-                verts.append((idx, v, delta))
-            self.frames.append(verts)
-
-        pass
+            vertex_count = reader.read_uint16()
+            if flags & VertexMeshAnimationFrameFlags.HasDeltaValues:
+                self.frames.append(reader.read_array(VERTEX_FRAME_DTYPE, vertex_count).copy())
+            else:
+                records = reader.read_array(_VERTEX_FRAME_NO_DELTA_DTYPE, vertex_count)
+                frame = np.zeros(vertex_count, VERTEX_FRAME_DTYPE)
+                frame['index'] = records['index']
+                frame['position'] = records['position']
+                self.frames.append(frame)
 
     def to_file(self, writer: ByteIO):
         writer.write_fmt('III', self.meshgroup_id, self.mesh_id, self.submesh_id)
         writer.write_uint32(len(self.frames))
         for flag, frame in zip(self.flags, self.frames):
+            frame = _frame_array(frame)
             writer.write_uint8(flag)
             writer.write_uint16(len(frame))
-            for (idx, v, delta) in frame:
-                writer.write_uint16(idx)
-                v.to_file(writer)
-                if flag & VertexMeshAnimationFrameFlags.HasDeltaValues:
-                    writer.write_uint16(delta)
+            if flag & VertexMeshAnimationFrameFlags.HasDeltaValues:
+                writer.write_array(frame)
+            else:
+                records = np.empty(len(frame), _VERTEX_FRAME_NO_DELTA_DTYPE)
+                records['index'] = frame['index']
+                records['position'] = frame['position']
+                writer.write_array(records)
 
 
 class VertexAnimation(PragmaBase):
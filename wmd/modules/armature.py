@@ -1,9 +1,21 @@
 from typing import List
 
+import numpy as np
+
 from . import *
+from ...shared.modules import quaternion
 from ...shared.modules.vector import *
 
 
+def transform_matrices(positions, rotations):
+    """(...,3) positions and (...,4) w,x,y,z rotations to (...,4,4) matrices"""
+    matrices = np.zeros(positions.shape[:-1] + (4, 4), np.float32)
+    matrices[..., :3, :3] = quaternion.to_matrix(rotations)
+    matrices[..., :3, 3] = positions
+    matrices[..., 3, 3] = 1
+    return matrices
+
+
 class Bone(PragmaBase):
     def __init__(self, armature, name="ERROR"):
         self._armature = armature  # type:Armature
@@ -28,7 +40,7 @@ class Bone(PragmaBase):
     def write_childs(self, writer: ByteIO):
         writer.write_uint32(len(self.childs))
         for child in self.childs:
-            writer.write_uint32(self._armature.bones.index(child))
+            writer.write_uint32(index_in(writer, self._armature.bones, child))
             child.write_childs(writer)
 
     def __str__(self):
@@ -46,8 +58,78 @@ class Armature(PragmaBase):
         self.bones = []  # type: List[Bone]
         self.roots = []  # type: List[Bone]
         self._bone_names = []  # type: List[str]
+        self._topology = None
+
+    def _get_topology(self):
+        if self._topology is None:
+            bone_ids = {id(bone): bone_id for bone_id, bone in enumerate(self.bones)}
+            parents = np.array([bone_ids[id(bone.parent)] if bone.parent is not None else -1 for bone in self.bones],
+                               np.int64)
+            levels = []
+            level = np.flatnonzero(parents == -1)
+            while level.size:
+                levels.append(level)
+                level = np.flatnonzero(np.isin(parents, level))
+            self._topology = bone_ids, parents, levels
+        return self._topology
+
+    def clear_topology_cache(self):
+        """Has to be called after bones are added, removed or reparented"""
+        self._topology = None
+
+    @property
+    def parent_indices(self):
+        """Parent index of every bone, -1 for roots"""
+        return self._get_topology()[1]
+
+    @property
+    def evaluation_levels(self):
+        """Bone indices grouped by depth, breadth-first: every bone comes after its parent"""
+        return self._get_topology()[2]
+
+    def bone_index(self, bone: Bone):
+        """Index of the bone in bones, looked up in the topology cache"""
+        try:
+            return self._get_topology()[0][id(bone)]
+        except KeyError:
+            raise ValueError(f"{bone} is not a bone of this armature") from None
+
+    def rest_pose(self):
+        """Local positions (bones,3) and w,x,y,z rotations (bones,4) of the reference pose"""
+        positions = np.array([bone.position.values for bone in self.bones], np.float32).reshape(-1, 3)
+        rotations = np.array([bone.rotation.values for bone in self.bones], np.float32).reshape(-1, 4)
+        return positions, rotations
+
+    def world_transforms(self, positions, rotations):
+        """
+        Forward kinematics of local poses for any number of frames.
+        :param positions: (...,bones,3) local positions
+        :param rotations: (...,bones,4) local w,x,y,z rotations
+        :return: world positions (...,bones,3) and rotations (...,bones,4)
+        """
+        parents = self.parent_indices
+        world_positions = np.array(positions, np.float32)
+        world_rotations = np.array(rotations, np.float32)
+        for level in self.evaluation_levels[1:]:
+            level_parents = parents[level]
+            parent_rotations = world_rotations[..., level_parents, :]
+            world_positions[..., level, :] = (world_positions[..., level_parents, :] +
+                                              quaternion.rotate(parent_rotations, world_positions[..., level, :]))
+            world_rotations[..., level, :] = quaternion.multiply(parent_rotations, world_rotations[..., level, :])
+        return world_positions, world_rotations
+
+    def world_matrices(self, positions, rotations):
+        """Forward kinematics like world_transforms, returns (...,bones,4,4) matrices"""
+        return transform_matrices(*self.world_transforms(positions, rotations))
+
+    def inverse_bind_matrices(self):
+        """(bones,4,4) inverses of the rest pose world matrices"""
+        world_positions, world_rotations = self.world_transforms(*self.rest_pose())
+        inverse_rotations = quaternion.conjugate(world_rotations)
+        return transform_matrices(-quaternion.rotate(inverse_rotations, world_positions), inverse_rotations)
 
     def from_file(self, reader: ByteIO):
+        self._topology = None
         bone_count = reader.read_uint32()
         for _ in range(bone_count):
             self._bone_names.append(reader.read_ascii_string())
@@ -72,5 +154,5 @@ class Armature(PragmaBase):
             bone.to_file(writer)
         writer.write_uint32(len(self.roots))
         for root in self.roots:
-            writer.write_uint32(self.bones.index(root))
+            writer.write_uint32(index_in(writer, self.bones, root))
             root.write_childs(writer)
@@ -21,7 +21,7 @@ class ObjectAttachment(PragmaBase):
         self.name = reader.read_ascii_string()
         self.attachment = reader.read_ascii_string()
         for _ in range(reader.read_uint32()):
-            key = reader.read_ascii_string()
+            key = reader.read_ascii_string(intern=True)
             self.key_values[key] = reader.read_ascii_string()
 
     def to_file(self, writer: ByteIO):
@@ -55,7 +55,7 @@ class Attachment(PragmaBase):
 
     def to_file(self, writer: ByteIO):
         writer.write_ascii_string(self.name)
-        writer.write_uint32(self._armature.bones.index(self.bone))
+        writer.write_uint32(index_in(writer, self._armature.bones, self.bone))
         self.offset.to_file(writer)
         self.angles.to_file(writer)
 
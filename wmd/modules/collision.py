@@ -1,6 +1,8 @@
 from enum import IntFlag
 from typing import List
 
+import numpy as np
+
 from . import Vector3F, PragmaBase, Constraint, Bone
 from ...byte_io_wmd import ByteIO
 
@@ -27,7 +29,7 @@ class CollisionMesh(PragmaBase):
         self.softbody_info = SoftBodyInfo(self)
 
     def from_file(self, reader: ByteIO):
-        if self.base.version >= 30:
+        if reader.context.version >= 30:
             self.flags = CollisionMeshFlags(reader.read_uint64())
         self.parent_bone = reader.read_int32()
         if self.parent_bone == -1:
@@ -37,11 +39,9 @@ class CollisionMesh(PragmaBase):
         self.min_bounds.from_file(reader)
         self.max_bounds.from_file(reader)
         vert_count = reader.read_uint64()
-        for _ in range(vert_count):
-            self.vertices.append(reader.read_fmt('3f'))
+        self.vertices = list(zip(*reader.read_array(np.float32, vert_count * 3).reshape(-1, 3).T.tolist()))
         index_count = reader.read_uint64()
-        for _ in range(index_count // 3):
-            self.indices.append(reader.read_fmt('3H'))
+        self.indices = list(zip(*reader.read_array(np.uint16, index_count // 3 * 3).reshape(-1, 3).T.tolist()))
         self.volume = reader.read_double()
         self.center_of_mass.from_file(reader)
         constraint_count = reader.read_uint8()
@@ -49,7 +49,7 @@ class CollisionMesh(PragmaBase):
             constraint = Constraint()
             constraint.from_file(reader)
             self.constraints.append(constraint)
-        if self.base.version >= 20:
+        if reader.context.version >= 20:
             self.softbody_info.from_file(reader)
 
     def to_file(self, writer: ByteIO):
@@ -60,11 +60,9 @@ class CollisionMesh(PragmaBase):
         self.min_bounds.to_file(writer)
         self.max_bounds.to_file(writer)
         writer.write_uint64(len(self.vertices))
-        for v in self.vertices:
-            writer.write_fmt('3f', *v)
+        writer.write_array(self.vertices, np.float32)
         writer.write_uint64(len(self.indices) * 3)
-        for v in self.indices:
-            writer.write_fmt('3H', *v)
+        writer.write_array(self.indices, np.uint16)
 
         writer.write_double(self.volume)
         self.center_of_mass.to_file(writer)
@@ -81,7 +79,7 @@ class SoftBodyInfo(PragmaBase):
         pass
 
     def from_file(self, reader: ByteIO):
-        if self.base.version < 30:
+        if reader.context.version < 30:
             softbody_data = reader.read_uint8() == 1
         else:
             softbody_data = (self._collision_mesh.flags & CollisionMeshFlags.SoftBody) != 0
@@ -101,7 +99,7 @@ class CollisionMeshInfo(PragmaBase):
 
     def from_file(self, reader: ByteIO):
         self.mass = reader.read_float()
-        if self.base.version < 30:
+        if reader.context.version < 30:
             mesh_count = reader.read_uint8()
         else:
             mesh_count = reader.read_uint32()
@@ -15,7 +15,7 @@ class Constraint(PragmaBase):
         self.collide = reader.read_uint8() == 1
         arg_count = reader.read_uint8()
         for _ in range(arg_count):
-            key = reader.read_ascii_string()
+            key = reader.read_ascii_string(intern=True)
             self.key_value[key] = reader.read_ascii_string()
 
     def to_file(self, writer: ByteIO):
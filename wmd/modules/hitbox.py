@@ -17,7 +17,7 @@ class HitBox(PragmaBase):
         self.max.from_file(reader)
 
     def to_file(self, writer: ByteIO):
-        writer.write_uint32(self._armature.bones.index(self.bone))
+        writer.write_uint32(index_in(writer, self._armature.bones, self.bone))
         writer.write_uint32(self.group)
         self.min.to_file(writer)
         self.max.to_file(writer)
@@ -16,7 +16,7 @@ class IKController(PragmaBase):
         self.chain_len = reader.read_uint32()
         self.method = reader.read_uint32()
         for _ in range(reader.read_uint32()):
-            key = reader.read_ascii_string()
+            key = reader.read_ascii_string(intern=True)
             self.key_values[key] = reader.read_ascii_string()
 
     def to_file(self, writer: ByteIO):
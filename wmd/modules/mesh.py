@@ -1,9 +1,62 @@
 from enum import IntEnum
 from typing import List, Dict
 
+import numpy as np
+
 from . import *
 from ...byte_io_wmd import ByteIO
 
+WEIGHT_DTYPE = np.dtype([('ids', np.int32, 4), ('weights', np.float32, 4)])
+
+
+def _index_array(values):
+    indices = np.asarray(values).reshape(-1)
+    if indices.size and indices.max() > 0xFFFF:
+        return indices.astype(np.uint32)
+    return indices.astype(np.uint16)
+
+
+def _weight_list(bone_ids, bone_weights):
+    return list(zip(map(tuple, bone_ids.tolist()), map(tuple, bone_weights.tolist())))
+
+
+def _weight_arrays(weights):
+    bone_ids = np.array([ids for ids, _ in weights], np.int32).reshape(-1, 4)
+    bone_weights = vector_array([values for _, values in weights], 4)
+    return bone_ids, bone_weights
+
+
+def _weight_records(bone_ids, bone_weights):
+    records = np.empty(len(bone_ids), WEIGHT_DTYPE)
+    records['ids'] = bone_ids
+    records['weights'] = bone_weights
+    return records
+
+
+def _int_array(values, width):
+    return np.ascontiguousarray(values, np.int32).reshape(-1, width)
+
+
+def _geometry_property(name, block, convert):
+    """
+    Geometry attribute that decodes its block on first access when the sub mesh was loaded lazily.
+    Assigned values are converted with convert and are never dropped by release().
+    """
+    attr = '_' + name
+
+    def getter(self):
+        value = getattr(self, attr)
+        if value is None:
+            self._load_block(block)
+            value = getattr(self, attr)
+        return value
+
+    def setter(self, value):
+        setattr(self, attr, convert(value))
+        self._owned.add(name)
+
+    return property(getter, setter)
+
 
 class SubMeshGeometryType(IntEnum):
     Triangles = 0
@@ -12,7 +65,33 @@ class SubMeshGeometryType(IntEnum):
 
 
 class SubMesh(PragmaBase):
+    """
+    Geometry is stored as contiguous arrays:
+    vertices, normals - (N,3) float32
+    uv_sets - name -> (N,2) float32
+    bone_ids, bone_weights - (N,4) int32 / float32, plus additional_* for influences 5-8
+    alphas - (N,2) float32
+    indices - uint16 (uint32 if any index doesn't fit)
+    weights and additional_weights are list views of (bone ids, weights) tuples.
+
+    Sub meshes loaded with lazy geometry only remember where their blocks are,
+    blocks are decoded on first access and cached until release().
+    """
+    _BLOCK_ATTRIBUTES = {
+        'vertices': ('vertices', 'normals'),
+        'uv_sets': ('uv_sets',),
+        'weights': ('bone_ids', 'bone_weights'),
+        'additional_weights': ('additional_bone_ids', 'additional_bone_weights'),
+        'alphas': ('alphas',),
+        'indices': ('indices',),
+    }
+
     def __init__(self):
+        self._reader = None  # type: ByteIO
+        self._version = 0
+        self._blocks = {}
+        self._owned = set()
+
         self.pos = Vector3F()
         self.rot = Vector4F()
         self.scale = Vector3F()
@@ -24,63 +103,181 @@ class SubMesh(PragmaBase):
         self.vertices = []
         self.normals = []
         self.uv_sets = {}
-        self.weights = []
-        self.additional_weights = []
+        self.bone_ids = []
+        self.bone_weights = []
+        self.additional_bone_ids = []
+        self.additional_bone_weights = []
         self.alpha_count = 0
-        self.alphas = []  # type:List[Vector2F]
+        self.alphas = []
         self.indices = []
         self.flexes = {}
 
+    vertices = _geometry_property('vertices', 'vertices', lambda values: vector_array(values, 3))
+    normals = _geometry_property('normals', 'vertices', lambda values: vector_array(values, 3))
+    uv_sets = _geometry_property('uv_sets', 'uv_sets', dict)  # type: Dict[str,np.ndarray]
+    bone_ids = _geometry_property('bone_ids', 'weights', lambda values: _int_array(values, 4))
+    bone_weights = _geometry_property('bone_weights', 'weights', lambda values: vector_array(values, 4))
+    additional_bone_ids = _geometry_property('additional_bone_ids', 'additional_weights',
+                                             lambda values: _int_array(values, 4))
+    additional_bone_weights = _geometry_property('additional_bone_weights', 'additional_weights',
+                                                 lambda values: vector_array(values, 4))
+    alphas = _geometry_property('alphas', 'alphas', lambda values: vector_array(values, 2))
+    indices = _geometry_property('indices', 'indices', _index_array)
+
+    @property
+    def weights(self):
+        return _weight_list(self.bone_ids, self.bone_weights)
+
+    @weights.setter
+    def weights(self, weights):
+        self.bone_ids, self.bone_weights = _weight_arrays(weights)
+
+    @property
+    def additional_weights(self):
+        return _weight_list(self.additional_bone_ids, self.additional_bone_weights)
+
+    @additional_weights.setter
+    def additional_weights(self, weights):
+        self.additional_bone_ids, self.additional_bone_weights = _weight_arrays(weights)
+
+    @property
+    def lazy(self):
+        return self._reader is not None
+
+    def _store(self, name, value):
+        if name not in self._owned:
+            setattr(self, '_' + name, value)
+
+    def _read_vertices(self, reader: ByteIO, vertex_count):
+        if self._version < 30:
+            vertex_data = reader.read_array(np.float32, vertex_count * 8).reshape(-1, 8)
+            self._store('uv_sets', {'base': vertex_data[:, 6:8].copy()})
+        else:
+            vertex_data = reader.read_array(np.float32, vertex_count * 6).reshape(-1, 6)
+        self._store('vertices', vertex_data[:, 0:3].copy())
+        self._store('normals', vertex_data[:, 3:6].copy())
+
+    def _read_uv_sets(self, reader: ByteIO, vertex_count, uv_set_count):
+        uv_sets = {}
+        for _ in range(uv_set_count):
+            uv_set_name = reader.read_ascii_string()
+            uv_sets[uv_set_name] = reader.read_array(np.float32, vertex_count * 2).reshape(-1, 2).copy()
+        self._store('uv_sets', uv_sets)
+
+    def _read_weights(self, reader: ByteIO, weight_count, prefix=''):
+        weights = reader.read_array(WEIGHT_DTYPE, weight_count)
+        self._store(prefix + 'bone_ids', weights['ids'].copy())
+        self._store(prefix + 'bone_weights', weights['weights'].copy())
+
+    def _read_alphas(self, reader: ByteIO, vertex_count):
+        alphas = np.zeros((vertex_count, 2), np.float32)
+        if self.alpha_count > 0:
+            alpha_width = min(self.alpha_count, 2)
+            alphas[:, :alpha_width] = reader.read_array(np.float32, vertex_count * alpha_width).reshape(-1, alpha_width)
+        else:
+            alphas = alphas[:0]
+        self._store('alphas', alphas)
+
+    def _read_indices(self, reader: ByteIO, indices_count):
+        self._store('indices', reader.read_array(np.uint16, indices_count).copy())
+
+    def _read_block(self, block, reader: ByteIO, *args):
+        if block == 'vertices':
+            self._read_vertices(reader, *args)
+        elif block == 'uv_sets':
+            self._read_uv_sets(reader, *args)
+        elif block == 'weights':
+            self._read_weights(reader, *args)
+        elif block == 'additional_weights':
+            self._read_weights(reader, *args, prefix='additional_')
+        elif block == 'alphas':
+            self._read_alphas(reader, *args)
+        elif block == 'indices':
+            self._read_indices(reader, *args)
+
+    def _block(self, block, reader: ByteIO, size, *args):
+        """Reads the block right away, or remembers where it is and skips it for lazy geometry"""
+        if self._reader is None:
+            self._read_block(block, reader, *args)
+            return
+        self._blocks[block] = (reader.tell(), args)
+        for name in self._BLOCK_ATTRIBUTES[block]:
+            self._store(name, None)
+        reader.skip(size)
+
+    def _load_block(self, block):
+        if block not in self._blocks:
+            # uv coordinates are part of the vertex block before version 30
+            block = 'vertices'
+        offset, args = self._blocks[block]
+        with self._reader.save_current_pos():
+            self._reader.seek(offset)
+            self._read_block(block, self._reader, *args)
+
+    def load_geometry(self):
+        """Decodes every block of a lazily loaded sub mesh that isn't decoded yet"""
+        for block, names in self._BLOCK_ATTRIBUTES.items():
+            if block in self._blocks and any(getattr(self, '_' + name) is None for name in names):
+                self._load_block(block)
+
+    def release(self):
+        """Drops decoded geometry of a lazily loaded sub mesh, it's decoded again on next access"""
+        if self._reader is None:
+            return
+        for block in self._blocks:
+            for name in self._BLOCK_ATTRIBUTES[block]:
+                self._store(name, None)
+        if self._version < 30:
+            self._store('uv_sets', None)
+
     def from_file(self, reader: ByteIO):
-        if self.base.version >= 26:
+        self._version = reader.context.version
+        self._reader = reader if reader.context.lazy_geometry else None
+        self._blocks.clear()
+        self._owned.clear()
+        if reader.context.version >= 26:
             self.pos.from_file(reader)
             self.rot.from_file(reader)
             self.scale.from_file(reader)
         self.material_id = reader.read_uint16()
-        if self.base.version >= 27:
+        if reader.context.version >= 27:
             self.geometry_type = SubMeshGeometryType(reader.read_uint8())
 
         vertex_count = reader.read_uint64()
-        if self.base.version < 30:
-            self.uv_sets["base"] = []
-        for _ in range(vertex_count):
-            self.vertices.append(reader.read_fmt("3f"))
-            self.normals.append(reader.read_fmt("3f"))
-            if self.base.version < 30:
-                self.uv_sets["base"].append(reader.read_fmt("2f"))
-
-        if self.base.version >= 30:
+        if reader.context.version < 30:
+            self._block('vertices', reader, vertex_count * 32, vertex_count)
+            if self._reader is not None:
+                self._store('uv_sets', None)
+        else:
+            self._block('vertices', reader, vertex_count * 24, vertex_count)
+
+        if reader.context.version >= 30:
             uv_set_count = reader.read_uint8()
-            for _ in range(uv_set_count):
-                uv_set_name = reader.read_ascii_string()
-                self.uv_sets[uv_set_name] = []
-                for _ in range(vertex_count):
-                    self.uv_sets[uv_set_name].append(reader.read_fmt("2f"))
+            uv_sets_size = 0
+            if self._reader is not None:
+                uv_sets_offset = reader.tell()
+                with reader.save_current_pos():
+                    for _ in range(uv_set_count):
+                        reader.read_ascii_string()
+                        reader.skip(vertex_count * 8)
+                    uv_sets_size = reader.tell() - uv_sets_offset
+            self._block('uv_sets', reader, uv_sets_size, vertex_count, uv_set_count)
 
         weight_count = reader.read_uint64()
-        for _ in range(weight_count):
-            self.weights.append((reader.read_fmt('4i'), reader.read_fmt('4f')))
+        self._block('weights', reader, weight_count * WEIGHT_DTYPE.itemsize, weight_count)
 
-        if self.base.version >= 27:
+        if reader.context.version >= 27:
             weight_count = reader.read_uint64()
-            for _ in range(weight_count):
-                self.additional_weights.append((reader.read_fmt('4i'), reader.read_fmt('4f')))
+            self._block('additional_weights', reader, weight_count * WEIGHT_DTYPE.itemsize, weight_count)
 
-        if self.base.version >= 30:
+        if reader.context.version >= 30:
             self.alpha_count = reader.read_uint8()
-            if self.alpha_count > 0:
-                for _ in range(vertex_count):
-                    alpha = Vector2F([0, 0])
-                    alpha.x = reader.read_float()
-                    if self.alpha_count > 1:
-                        alpha.y = reader.read_float()
-                    self.alphas.append(alpha)
+            self._block('alphas', reader, vertex_count * 4 * min(self.alpha_count, 2), vertex_count)
 
         indices_count = reader.read_uint32()
-        if self.base.version < 30:
+        if reader.context.version < 30:
             indices_count *= 3
-        for _ in range(indices_count):
-            self.indices.append(reader.read_uint16())
+        self._block('indices', reader, indices_count * 2, indices_count)
 
     def to_file(self, writer: ByteIO):
         self.pos.to_file(writer)
@@ -91,36 +288,28 @@ class SubMesh(PragmaBase):
         writer.write_uint8(self.geometry_type.value)
 
         writer.write_uint64(len(self.vertices))
-        for v, n in zip(self.vertices, self.normals):
-            writer.write_fmt('3f', *v)
-            writer.write_fmt('3f', *n)
+        writer.write_array(np.hstack((self.vertices, self.normals)), np.float32)
 
         writer.write_uint8(len(self.uv_sets))
         for uv_set_name, uv_set in self.uv_sets.items():
             writer.write_ascii_string(uv_set_name)
-            for u in uv_set:
-                writer.write_fmt("2f", *u)
+            writer.write_array(vector_array(uv_set, 2))
 
-        writer.write_uint64(len(self.weights))
-        for (b, w) in self.weights:
-            writer.write_fmt('4i', *b)
-            writer.write_fmt('4f', *w)
+        writer.write_uint64(len(self.bone_ids))
+        writer.write_array(_weight_records(self.bone_ids, self.bone_weights))
 
-        writer.write_uint64(len(self.additional_weights))
-        for (b, w) in self.additional_weights:
-            writer.write_fmt('4i', *b)
-            writer.write_fmt('4f', *w)
+        writer.write_uint64(len(self.additional_bone_ids))
+        writer.write_array(_weight_records(self.additional_bone_ids, self.additional_bone_weights))
 
         writer.write_uint8(self.alpha_count)
-        if self.alphas:
-            for alpha in self.alphas:
-                writer.write_float(alpha.x)
-                if self.alpha_count > 1:
-                    writer.write_float(alpha.y)
+        if self.alpha_count:
+            writer.write_array(self.alphas[:, :min(self.alpha_count, 2)], np.float32)
 
-        writer.write_uint32(len(self.indices))
-        for ind in self.indices:
-            writer.write_fmt('H', *ind)
+        indices = self.indices
+        if indices.dtype != np.uint16:
+            raise ValueError("WMD index buffers are 16 bit, too many vertices in sub mesh")
+        writer.write_uint32(len(indices))
+        writer.write_array(indices)
 
 
 class Mesh(PragmaBase):
@@ -134,13 +323,13 @@ class Mesh(PragmaBase):
 
     def from_file(self, reader: ByteIO):
         self.name = reader.read_ascii_string()
-        if self.base.version < 30:
+        if reader.context.version < 30:
             mesh_count = reader.read_uint8()
         else:
             mesh_count = reader.read_uint32()
         for _ in range(mesh_count):
             meshes = []
-            if self.base.version <= 23:
+            if reader.context.version <= 23:
                 pass  # TODO
             else:
                 sub_mesh_count = reader.read_uint32()
@@ -159,6 +348,14 @@ class Mesh(PragmaBase):
             for sub_mesh in mesh:
                 sub_mesh.to_file(writer)
 
+    def load_geometry(self):
+        for sub_mesh in self.sub_meshes:
+            sub_mesh.load_geometry()
+
+    def release(self):
+        for sub_mesh in self.sub_meshes:
+            sub_mesh.release()
+
 
 class MeshGroup(PragmaBase):
     def __init__(self):
@@ -181,8 +378,7 @@ class MeshGroup(PragmaBase):
             pass
 
         base_mesh_count = reader.read_uint16()
-        for i in range(base_mesh_count):
-            self.group_ids.append(reader.read_uint32())
+        self.group_ids = reader.read_array(np.uint32, base_mesh_count).tolist()
 
     def to_file(self, writer: ByteIO):
         self.rb_min.to_file(writer)
@@ -192,8 +388,11 @@ class MeshGroup(PragmaBase):
             mesh_group.to_file(writer)
 
         writer.write_uint16(len(self.group_ids))
-        for group_id in self.group_ids:
-            writer.write_uint32(group_id)
+        writer.write_array(self.group_ids, np.uint32)
+
+    def release(self):
+        for mesh in self.mesh_groups:
+            mesh.release()
 
     def read_bodygroups(self, reader: ByteIO):
         bodygroup_count = reader.read_uint16()
@@ -210,4 +409,4 @@ class MeshGroup(PragmaBase):
             writer.write_ascii_string(name)
             writer.write_uint8(len(bodygroup))
             for body in bodygroup:
-                writer.write_uint32(self.mesh_groups.index(body))
+                writer.write_uint32(index_in(writer, self.mesh_groups, body))
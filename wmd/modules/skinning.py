@@ -0,0 +1,116 @@
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from .armature import Armature
+from .mesh import SubMesh
+
+# vertices are skinned in chunks so the intermediate arrays stay around this size
+_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def _influences(sub_mesh: SubMesh):
+    """Bone ids and normalized weights of up to 8 influences per vertex, unused slots get weight 0"""
+    vertex_count = len(sub_mesh.vertices)
+    bone_ids = sub_mesh.bone_ids
+    bone_weights = sub_mesh.bone_weights
+    if len(bone_ids) != vertex_count:
+        # no usable weight table, every vertex keeps its bind pose
+        return np.zeros((vertex_count, 0), np.int32), np.zeros((vertex_count, 0), np.float32), \
+               np.zeros(vertex_count, bool)
+    if len(sub_mesh.additional_bone_ids) == len(bone_ids):
+        bone_ids = np.hstack((bone_ids, sub_mesh.additional_bone_ids))
+        bone_weights = np.hstack((bone_weights, sub_mesh.additional_bone_weights))
+    bone_weights = np.where(bone_ids >= 0, bone_weights, 0).astype(np.float32)
+    bone_ids = np.maximum(bone_ids, 0)
+    totals = bone_weights.sum(axis=1, keepdims=True)
+    bone_weights /= np.where(totals > 0, totals, 1)
+    return bone_ids, bone_weights, totals[:, 0] > 0
+
+
+def skin_chunks(sub_mesh: SubMesh, armature: Armature, world_matrices, inverse_bind_matrices=None,
+                normals=True) -> Iterator[Tuple[slice, np.ndarray, Optional[np.ndarray]]]:
+    """
+    Skins the sub mesh a range of vertices at a time, for reductions over meshes and frame counts
+    too large to keep every skinned frame in memory.
+    :param world_matrices: (frames,bones,4,4) bone world matrices
+    :return: iterator of (vertex slice, positions, normals), positions and normals are (vertices,frames,3),
+    normals is None without normals=True
+    """
+    world_matrices = np.asarray(world_matrices, np.float32)
+    if world_matrices.shape[1] != len(armature.bones):
+        raise ValueError(f"Expected matrices of {len(armature.bones)} bones, got {world_matrices.shape[1]}")
+    if inverse_bind_matrices is None:
+        inverse_bind_matrices = armature.inverse_bind_matrices()
+
+    vertices = sub_mesh.vertices
+    vertex_normals = sub_mesh.normals
+    vertex_count = len(vertices)
+    frame_count = len(world_matrices)
+    bone_ids, bone_weights, skinned = _influences(sub_mesh)
+    # only bones the sub mesh is weighted to are evaluated
+    used_bones, columns = np.unique(bone_ids, return_inverse=True)
+    columns = columns.reshape(bone_ids.shape)
+    skinning_matrices = (world_matrices[:, used_bones] @ inverse_bind_matrices[used_bones])[:, :, :3, :]
+    # (bones*4, frames*3): skinning every vertex of every frame becomes a single matrix product
+    # of the weighted homogeneous vertex rows with all bone matrices
+    skinning_matrices = np.ascontiguousarray(skinning_matrices.transpose(1, 3, 0, 2)).reshape(
+        len(used_bones) * 4, frame_count * 3)
+
+    row_count = 2 if normals else 1
+    row_bytes = (len(used_bones) * 4 + frame_count * 3) * 4 * row_count
+    chunk = max(1, _CHUNK_BYTES // row_bytes)
+    for start in range(0, vertex_count, chunk):
+        end = min(start + chunk, vertex_count)
+        count = end - start
+        rows = np.zeros((row_count, count, len(used_bones), 4), np.float32)
+        chunk_rows = np.arange(count)
+        for influence in range(bone_ids.shape[1]):
+            weights = bone_weights[start:end, influence, None]
+            bones = columns[start:end, influence]
+            rows[0, chunk_rows, bones, :3] += vertices[start:end] * weights
+            rows[0, chunk_rows, bones, 3] += weights[:, 0]
+            if normals:
+                rows[1, chunk_rows, bones, :3] += vertex_normals[start:end] * weights
+        result = (rows.reshape(row_count * count, -1) @ skinning_matrices).reshape(row_count, count, frame_count, 3)
+
+        unskinned = np.flatnonzero(~skinned[start:end])
+        if unskinned.size:
+            result[0, unskinned] = vertices[start + unskinned, None]
+            if normals:
+                result[1, unskinned] = vertex_normals[start + unskinned, None]
+        if normals:
+            lengths = np.linalg.norm(result[1], axis=-1, keepdims=True)
+            result[1] /= np.where(lengths > 0, lengths, 1)
+        yield slice(start, end), result[0], result[1] if normals else None
+
+
+def skin(sub_mesh: SubMesh, armature: Armature, world_matrices,
+         inverse_bind_matrices=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Linear blend skinning of a sub mesh for any number of poses.
+    Influences of a vertex are normalized, vertices without any keep their bind pose.
+    :param world_matrices: (frames,bones,4,4) or (bones,4,4) bone world matrices, see Armature.world_matrices
+    :param inverse_bind_matrices: (bones,4,4), Armature.inverse_bind_matrices() if not given
+    :return: positions and normals, (frames,vertices,3) or (vertices,3) for a single pose
+    """
+    world_matrices = np.asarray(world_matrices, np.float32)
+    single = world_matrices.ndim == 3
+    if single:
+        world_matrices = world_matrices[None]
+    shape = (len(world_matrices), len(sub_mesh.vertices), 3)
+    positions = np.empty(shape, np.float32)
+    normals = np.empty(shape, np.float32)
+    for vertices, chunk_positions, chunk_normals in skin_chunks(sub_mesh, armature, world_matrices,
+                                                                inverse_bind_matrices):
+        positions[:, vertices] = chunk_positions.transpose(1, 0, 2)
+        normals[:, vertices] = chunk_normals.transpose(1, 0, 2)
+    if single:
+        return positions[0], normals[0]
+    return positions, normals
+
+
+def skin_animation(sub_mesh: SubMesh, armature: Armature, positions, rotations,
+                   inverse_bind_matrices: Optional[np.ndarray] = None):
+    """skin() for local poses, such as the ones returned by AnimationSampler.sample with the armature"""
+    return skin(sub_mesh, armature, armature.world_matrices(positions, rotations), inverse_bind_matrices)
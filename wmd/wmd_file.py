@@ -1,11 +1,52 @@
+import os
+import struct
+import typing
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntFlag, auto
-from typing import List
+from io import BytesIO
+from typing import List, Dict, NamedTuple, Optional, Tuple
 from .modules import *
+from .modules.collision import CollisionMeshFlags
 
-from ..byte_io_wmd import ByteIO
+from ..byte_io_wmd import ByteIO, StreamSink
 
 MAX_SUPPORTED_VERSION = 30
 
+# sections in file order, each one can be loaded on its own with Model.load_section
+SECTIONS = ('model_data', 'meshes', 'lods', 'bodygroups', 'collision',
+            'blend_controllers', 'ik_controllers', 'animations', 'eyeballs', 'include_models')
+# header offset of each section, sections without one follow the previous section
+_SECTION_OFFSETS = {
+    'model_data': 'offset_model_data',
+    'meshes': 'offset_meshes',
+    'lods': 'offset_lod_data',
+    'bodygroups': 'offset_bodygroups',
+    'collision': 'offset_collision_mesh',
+    'ik_controllers': 'offset_ik_controllers',
+    'animations': 'offset_animations',
+    'eyeballs': 'offset_eyeballs',
+}
+# sections that reference data of other sections
+_SECTION_DEPENDENCIES = {
+    'bodygroups': ('meshes',),
+    'animations': ('blend_controllers', 'bodygroups'),
+}
+
+
+def _section_attribute(name, section):
+    """Model attribute that loads its section on first access when the model was opened with read_index"""
+    attr = '_' + name
+
+    def getter(self):
+        if section in self._pending_sections:
+            self.load_section(section)
+        return getattr(self, attr)
+
+    def setter(self, value):
+        setattr(self, attr, value)
+
+    return property(getter, setter)
+
 
 class ModelFlags(IntFlag):
     NONE = 0
@@ -19,9 +60,80 @@ class ModelFlags(IntFlag):
     DontPrecacheTextureGroups = auto()
 
 
+class ModelScan(NamedTuple):
+    """Metadata gathered by Model.check_header(reader, scan=True) without parsing the model"""
+    path: str
+    version: int
+    flags: ModelFlags
+    material_paths: Tuple[str, ...]
+    include_models: Optional[Tuple[str, ...]]  # None if they can't be reached without parsing animations
+    section_sizes: Dict[str, int]  # bytes from each section offset in the header to the next one
+    file_size: int
+
+    @property
+    def static(self):
+        return bool(self.flags & ModelFlags.Static)
+
+
+def _read_header_offsets(reader: ByteIO, version, skinned):
+    names = ['offset_model_data', 'offset_meshes', 'offset_lod_data', 'offset_bodygroups', 'offset_collision_mesh']
+    if skinned:
+        names += ['offset_bones', 'offset_animations']
+        if version >= 21:
+            names += ['offset_vertex_animations', 'offset_flex_controllers', 'offset_flexes', 'offset_phoneme_map']
+        if version >= 22:
+            names.append('offset_ik_controllers')
+        if version >= 28:
+            names.append('offset_eyeballs')
+    return {name: reader.read_uint64() for name in names}
+
+
+def _skip_collision(reader: ByteIO, version):
+    """Walks the collision section without reading vertex and index data, returns False on soft bodies"""
+    reader.skip(4)  # mass
+    mesh_count = reader.read_uint8() if version < 30 else reader.read_uint32()
+    for _ in range(mesh_count):
+        flags = CollisionMeshFlags(reader.read_uint64()) if version >= 30 else CollisionMeshFlags(0)
+        reader.skip(4 + 12)  # parent bone, origin
+        reader.read_ascii_string()
+        reader.skip(12 * 2)  # bounds
+        reader.skip(reader.read_uint64() * 12)
+        reader.skip(reader.read_uint64() // 3 * 3 * 2)
+        reader.skip(8 + 12)  # volume, center of mass
+        for _ in range(reader.read_uint8()):
+            Constraint().from_file(reader)
+        if version >= 20:
+            soft_body = reader.read_uint8() == 1 if version < 30 else bool(flags & CollisionMeshFlags.SoftBody)
+            if soft_body:
+                return False
+    return True
+
+
 class Model(PragmaBase):
+    material_paths = _section_attribute('material_paths', 'model_data')
+    materials = _section_attribute('materials', 'model_data')
+    skins = _section_attribute('skins', 'model_data')
+    armature = _section_attribute('armature', 'model_data')
+    attachments = _section_attribute('attachments', 'model_data')
+    object_attachments = _section_attribute('object_attachments', 'model_data')
+    hitboxes = _section_attribute('hitboxes', 'model_data')
+    mesh = _section_attribute('mesh', 'bodygroups')
+    lod_info = _section_attribute('lod_info', 'lods')
+    collision_mesh = _section_attribute('collision_mesh', 'collision')
+    blend_controllers = _section_attribute('blend_controllers', 'blend_controllers')
+    ik_controllers = _section_attribute('ik_controllers', 'ik_controllers')
+    animation_info = _section_attribute('animation_info', 'animations')
+    max_eye_deflection = _section_attribute('max_eye_deflection', 'eyeballs')
+    eyeballs = _section_attribute('eyeballs', 'eyeballs')
+    include_models = _section_attribute('include_models', 'include_models')
+
     def __init__(self):
-        PragmaBase.set_base(self)
+        self._reader = None  # type: ByteIO
+        self._pending_sections = set()
+        self._section_ends = {}
+        self._mesh_selection = None
+        self._resolved_mesh_groups = {}
+        self.section_index = {}
         self.name = ""
         self.version = 0
         self.flags = ModelFlags(0)
@@ -63,9 +175,6 @@ class Model(PragmaBase):
         self.ik_controllers = []  # type:List[IKController]
         self.animation_info = AnimationInfo()
 
-        self.offsets_offset = 0
-        self.skinned_data_offset = 0
-
         self.include_models = []  # type:List[str]
 
     @property
@@ -76,7 +185,7 @@ class Model(PragmaBase):
     def skinned(self):
         return not self.static
 
-    def from_file(self, reader: ByteIO):
+    def _read_header(self, reader: ByteIO):
         header = reader.read_ascii_string(3)
         assert header == 'WMD', "invalid header"
         self.version = reader.read_uint16()
@@ -84,134 +193,321 @@ class Model(PragmaBase):
         self.flags = ModelFlags(reader.read_uint32())
         self.eye_offset.from_file(reader)
 
-        self.offset_model_data = reader.read_uint64()
-        self.offset_meshes = reader.read_uint64()
-        self.offset_lod_data = reader.read_uint64()
-        self.offset_bodygroups = reader.read_uint64()
-        self.offset_collision_mesh = reader.read_uint64()
+        for name, offset in _read_header_offsets(reader, self.version, self.skinned).items():
+            setattr(self, name, offset)
+
+    def read_index(self, reader: ByteIO, lazy_geometry=False, lod=None, bodygroups=None):
+        """
+        Reads only the header, every other section is loaded on first access of one of its attributes
+        or with load_section. Reader has to stay open until all needed sections are loaded.
+        :param lazy_geometry: skip sub mesh geometry and decode it on first access
+        :param lod: with bodygroups, selects mesh groups (see resolve_mesh_groups) whose geometry is decoded
+        once meshes, LODs and bodygroups are loaded, geometry of other mesh groups is left undecoded
+        :param bodygroups: bodygroup name -> index of the chosen mesh group
+        """
+        with reader.profile('header'):
+            self._read_header(reader)
+        if lod is not None or bodygroups is not None:
+            self._mesh_selection = (lod or 0, bodygroups)
+            lazy_geometry = True
+        reader.context = ParseContext(self, self.version, lazy_geometry)
+        self._reader = reader
+        self._section_ends = {}
+        self._pending_sections = set(SECTIONS)
+        self.section_index = {name: getattr(self, offset_name) for name, offset_name in _SECTION_OFFSETS.items()
+                              if self._has_section(name)}
+
+    def from_file(self, reader: ByteIO, lazy_geometry=False, lod=None, bodygroups=None):
+        """
+        :param lazy_geometry: skip sub mesh geometry and decode it on first access,
+        reader has to stay open while the model is in use
+        :param lod: with bodygroups, decode geometry only of mesh groups shown at this LOD and bodygroup selection,
+        see resolve_mesh_groups. Others stay undecoded like with lazy_geometry
+        :param bodygroups: bodygroup name -> index of the chosen mesh group
+        """
+        self.read_index(reader, lazy_geometry, lod, bodygroups)
+        for name in SECTIONS:
+            self.load_section(name)
+
+    def load_section(self, name):
+        """
+        Loads a single section of a model opened with read_index, sections it depends on are loaded first.
+        :param name: one of SECTIONS
+        """
+        if name not in SECTIONS:
+            raise KeyError(f"Unknown model section {name}")
+        if name not in self._pending_sections:
+            return
+        self._pending_sections.discard(name)
+        reader = self._reader
+        if self._has_section(name):
+            for dependency in _SECTION_DEPENDENCIES.get(name, ()):
+                self.load_section(dependency)
+            offset_name = _SECTION_OFFSETS.get(name)
+            if offset_name is not None:
+                offset = getattr(self, offset_name)
+            else:
+                offset = self._previous_section_end(name)
+            reader.seek(offset)
+            getattr(self, '_read_' + name)(reader)
+            self._section_ends[name] = reader.tell()
+        else:
+            self._section_ends[name] = self._previous_section_end(name)
+        if self._mesh_selection is not None and {'bodygroups', 'lods'}.isdisjoint(self._pending_sections):
+            lod, bodygroups = self._mesh_selection
+            self._mesh_selection = None
+            for mesh in self.resolve_mesh_groups(lod, bodygroups):
+                mesh.load_geometry()
+        if not self._pending_sections:
+            self._reader = None
 
-        if self.skinned:
-            self.offset_bones = reader.read_uint64()
-            self.offset_animations = reader.read_uint64()
-            if self.version >= 21:
-                self.offset_vertex_animations = reader.read_uint64()
-                self.offset_flex_controllers = reader.read_uint64()
-                self.offset_flexes = reader.read_uint64()
-                self.offset_phoneme_map = reader.read_uint64()
-            if self.version >= 22:
-                self.offset_ik_controllers = reader.read_uint64()
-            if self.version >= 28:
-                self.offset_eyeballs = reader.read_uint64()
-
-        material_path_count = reader.read_uint8()
-        for i in range(material_path_count):
-            self.material_paths.append(reader.read_ascii_string())
+    @property
+    def loaded_sections(self):
+        return [name for name in SECTIONS if name not in self._pending_sections]
+
+    def resolve_mesh_groups(self, lod=0, bodygroups=None):
+        """
+        Mesh groups shown at a LOD with a bodygroup selection: base mesh groups plus the chosen mesh group
+        of every bodygroup, with replacements of the highest LOD at or below lod applied.
+        Results are cached per model, clear_mesh_group_cache after changing meshes, LODs or bodygroups.
+        :param bodygroups: bodygroup name -> index of the chosen mesh group, unlisted bodygroups use the first one
+        :rtype: List[Mesh]
+        """
+        bodygroups = bodygroups or {}
+        key = (lod, tuple(sorted(bodygroups.items())))
+        mesh_groups = self._resolved_mesh_groups.get(key)
+        if mesh_groups is None:
+            mesh_groups = self._resolved_mesh_groups[key] = self._resolve_mesh_groups(lod, bodygroups)
+        return mesh_groups
+
+    def clear_mesh_group_cache(self):
+        self._resolved_mesh_groups.clear()
+
+    def bake_animation_bounds(self, use_hitboxes=False, lod=0, bodygroups=None):
+        """
+        Recomputes min and max of every armature animation before saving edited animations.
+        Measures the skinned meshes shown at lod with bodygroups, or the much cheaper hitbox corners.
+        :return: (frames,2,3) per frame bounds of every animation
+        """
+        animations = self.animation_info.armature_animations
+        if use_hitboxes:
+            return bake_animation_bounds(animations, self.armature, hitboxes=self.hitboxes)
+        sub_meshes = [sub_mesh for mesh_group in self.resolve_mesh_groups(lod, bodygroups)
+                      for sub_mesh in mesh_group.sub_meshes]
+        return bake_animation_bounds(animations, self.armature, sub_meshes=sub_meshes)
+
+    def _resolve_mesh_groups(self, lod, bodygroups):
+        mesh = self.mesh
+        for name in bodygroups:
+            if name not in mesh.bodygroups:
+                raise KeyError(f"Unknown bodygroup {name}")
+        group_indices = {id(mesh_group): i for i, mesh_group in enumerate(mesh.mesh_groups)}
+        group_ids = list(mesh.group_ids)
+        for name, bodygroup in mesh.bodygroups.items():
+            choice = bodygroups.get(name, 0)
+            if 0 <= choice < len(bodygroup):
+                group_ids.append(group_indices[id(bodygroup[choice])])
+
+        lod_ids = [lod_id for lod_id in self.lod_info.lods if lod_id <= lod]
+        if lod_ids:
+            replacements = dict(self.lod_info.lods[max(lod_ids)])  # original -> replacement, -1 removes
+            group_ids = [replacements.get(group_id, group_id) for group_id in group_ids]
+        return [mesh.mesh_groups[group_id] for group_id in dict.fromkeys(group_ids)
+                if 0 <= group_id < len(mesh.mesh_groups)]
+
+    def _previous_section_end(self, name):
+        previous = SECTIONS[SECTIONS.index(name) - 1]
+        self.load_section(previous)
+        return self._section_ends[previous]
+
+    def _has_section(self, name):
+        if name == 'collision':
+            return self.offset_collision_mesh > 0
+        if name in ('blend_controllers', 'ik_controllers', 'animations', 'eyeballs') and self.static:
+            return False
+        if name == 'ik_controllers':
+            return self.version >= 22
+        if name == 'eyeballs':
+            return self.version >= 28
+        return True
+
+    def _read_model_data(self, reader: ByteIO):
+        with reader.profile('material_paths') as section:
+            material_path_count = reader.read_uint8()
+            for i in range(material_path_count):
+                self.material_paths.append(reader.read_ascii_string())
+            section.count = material_path_count
 
         # armature and attachments
         if self.skinned:
-            self.armature.from_file(reader)
-
-            attachment_count = reader.read_uint32()
-            for _ in range(attachment_count):
-                attachment = Attachment(self.armature)
-                attachment.from_file(reader)
-                self.attachments.append(attachment)
-
-            if self.version >= 23:
-                object_attachment_count = reader.read_uint32()
-                for _ in range(object_attachment_count):
-                    object_attachment = ObjectAttachment()
-                    object_attachment.from_file(reader)
-                    self.object_attachments.append(object_attachment)
-            hitbox_count = reader.read_uint32()
-            for _ in range(hitbox_count):
-                hitbox = HitBox(self.armature)
-                hitbox.from_file(reader)
-                self.hitboxes.append(hitbox)
-
-        base_material_count = reader.read_uint16()
-        material_count = reader.read_uint16()
-        for _ in range(material_count):
-            self.materials.append(reader.read_ascii_string())
-
-        for skin_id in range(reader.read_int16()):
-            skin = []
-            for _ in range(base_material_count):
-                skin.append(self.materials[reader.read_uint16()])
-            self.skins.append(skin)
-        self.mesh.from_file(reader)
-        self.lod_info.from_file(reader)
-        self.mesh.read_bodygroups(reader)
-        if self.offset_collision_mesh > 0:
-            reader.seek(self.offset_collision_mesh)
+            with reader.profile('armature') as section:
+                self.armature.from_file(reader)
+                section.count = len(self.armature.bones)
+
+            with reader.profile('attachments') as section:
+                attachment_count = reader.read_uint32()
+                for _ in range(attachment_count):
+                    attachment = Attachment(self.armature)
+                    attachment.from_file(reader)
+                    self.attachments.append(attachment)
+
+                if self.version >= 23:
+                    object_attachment_count = reader.read_uint32()
+                    for _ in range(object_attachment_count):
+                        object_attachment = ObjectAttachment()
+                        object_attachment.from_file(reader)
+                        self.object_attachments.append(object_attachment)
+                section.count = len(self.attachments) + len(self.object_attachments)
+
+            with reader.profile('hitboxes') as section:
+                hitbox_count = reader.read_uint32()
+                for _ in range(hitbox_count):
+                    hitbox = HitBox(self.armature)
+                    hitbox.from_file(reader)
+                    self.hitboxes.append(hitbox)
+                section.count = hitbox_count
+
+        with reader.profile('materials') as section:
+            base_material_count = reader.read_uint16()
+            material_count = reader.read_uint16()
+            for _ in range(material_count):
+                self.materials.append(reader.read_ascii_string())
+
+            for skin_id in range(reader.read_int16()):
+                skin = []
+                for _ in range(base_material_count):
+                    skin.append(self.materials[reader.read_uint16()])
+                self.skins.append(skin)
+            section.count = material_count
+
+    def _read_meshes(self, reader: ByteIO):
+        with reader.profile('mesh_groups') as section:
+            self._mesh.from_file(reader)
+            section.count = len(self._mesh.mesh_groups)
+
+    def _read_lods(self, reader: ByteIO):
+        with reader.profile('lods') as section:
+            self.lod_info.from_file(reader)
+            section.count = len(self.lod_info.lods)
+
+    def _read_bodygroups(self, reader: ByteIO):
+        with reader.profile('bodygroups') as section:
+            self._mesh.read_bodygroups(reader)
+            section.count = len(self._mesh.bodygroups)
+
+    def _read_collision(self, reader: ByteIO):
+        with reader.profile('collision') as section:
             self.collision_mesh.from_file(reader)
+            section.count = len(self.collision_mesh.meshes)
 
-        if self.skinned:
+    def _read_blend_controllers(self, reader: ByteIO):
+        with reader.profile('blend_controllers') as section:
             blend_controllers_count = reader.read_uint16()
             for _ in range(blend_controllers_count):
                 controller = BlendController()
                 controller.from_file(reader)
                 self.blend_controllers.append(controller)
-            if self.version >= 22:
-                ik_controllers_count = reader.read_uint32()
-                for _ in range(ik_controllers_count):
-                    ik_controller = IKController()
-                    ik_controller.from_file(reader)
-                    self.ik_controllers.append(ik_controller)
-
+            section.count = blend_controllers_count
+
+    def _read_ik_controllers(self, reader: ByteIO):
+        with reader.profile('ik_controllers') as section:
+            ik_controllers_count = reader.read_uint32()
+            for _ in range(ik_controllers_count):
+                ik_controller = IKController()
+                ik_controller.from_file(reader)
+                self.ik_controllers.append(ik_controller)
+            section.count = ik_controllers_count
+
+    def _read_animations(self, reader: ByteIO):
+        with reader.profile('animations'):
             self.animation_info.from_file(reader)
 
-            if self.base.version >= 28:
-                reader.seek(self.offset_eyeballs)
-                self.max_eye_deflection = reader.read_float()
-                for _ in range(reader.read_uint32()):
-                    eyeball = Eyeball()
-                    eyeball.from_file(reader)
-                    self.eyeballs.append(eyeball)
-
-        for _ in range(reader.read_uint8()):
-            self.include_models.append(reader.read_ascii_string())
+    def _read_eyeballs(self, reader: ByteIO):
+        with reader.profile('eyeballs') as section:
+            self.max_eye_deflection = reader.read_float()
+            for _ in range(reader.read_uint32()):
+                eyeball = Eyeball()
+                eyeball.from_file(reader)
+                self.eyeballs.append(eyeball)
+            section.count = len(self.eyeballs)
+
+    def _read_include_models(self, reader: ByteIO):
+        with reader.profile('include_models') as section:
+            for _ in range(reader.read_uint8()):
+                self.include_models.append(reader.read_ascii_string())
+            section.count = len(self.include_models)
 
     def to_file(self, writer: ByteIO):
+        for _ in self._write_sections(writer):
+            pass
+        writer.resolve_offsets()
+
+    def iter_bytes(self):
+        """
+        Serializes the model section by section, yielding the bytes of each section.
+        Section offsets are laid out in a first pass that doesn't keep any data,
+        so at most one section is held in memory at a time.
+        """
+        writer = self._stream_writer(BytesIO())
+        buffer = writer.file.target
+        for _ in self._write_sections(writer):
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        writer.resolve_offsets()
+
+    def write_stream(self, stream: typing.BinaryIO):
+        """
+        Writes the model to any writable binary stream, including pipes and other non-seekable streams.
+        Returns number of bytes written.
+        """
+        writer = self._stream_writer(stream)
+        self.to_file(writer)
+        return writer.tell()
+
+    def _stream_writer(self, target):
+        layout = ByteIO(file=StreamSink())
+        for _ in self._write_sections(layout):
+            pass
+        writer = ByteIO(file=StreamSink(target))
+        for name, offset in layout.offsets.items():
+            writer.mark_offset(name, offset)
+        return writer
+
+    def _write_sections(self, writer: ByteIO):
+        writer.context = ParseContext(self, MAX_SUPPORTED_VERSION)
         writer.write_ascii_string("WMD", False)
         writer.write_uint16(MAX_SUPPORTED_VERSION)  # version
         writer.write_uint32(self.flags.value)
         self.eye_offset.to_file(writer)
 
-        self.offsets_offset = offsets_offset = writer.tell()
-        writer.write_uint64(0)
-        writer.write_uint64(0)
-        writer.write_uint64(0)
-        writer.write_uint64(0)
-        writer.write_uint64(0)
+        writer.reserve_offset('model_data')
+        writer.reserve_offset('meshes')
+        writer.reserve_offset('lod_data')
+        writer.reserve_offset('bodygroups')
+        writer.reserve_offset('collision_mesh')
 
-        self.skinned_data_offset = offsets_skinned_data = writer.tell()
         if self.skinned:
-            writer.write_uint64(0)
-            writer.write_uint64(0)
+            writer.reserve_offset('bones')
+            writer.reserve_offset('animations')
 
-            writer.write_uint64(0)
-            writer.write_uint64(0)
-            writer.write_uint64(0)
-            writer.write_uint64(0)
+            writer.reserve_offset('vertex_animations')
+            writer.reserve_offset('flex_controllers')
+            writer.reserve_offset('flexes')
+            writer.reserve_offset('phoneme_map')
 
-            writer.write_uint64(0)
-            writer.write_uint64(0)
+            writer.reserve_offset('ik_controllers')
+            writer.reserve_offset('eyeballs')
+        yield 'header'
 
-        with writer.save_current_pos():
-            model_data_offset = writer.tell()
-            writer.seek(offsets_offset)
-            writer.write_uint64(model_data_offset)
+        writer.mark_offset('model_data')
 
         writer.write_int8(len(self.material_paths))
         for path in self.material_paths:
             writer.write_ascii_string(path, True)
 
         if self.skinned:
-            with writer.save_current_pos():
-                armature_offset = writer.tell()
-                writer.seek(offsets_skinned_data)
-                writer.write_uint64(armature_offset)
+            writer.mark_offset('bones')
             self.armature.to_file(writer)
 
             writer.write_uint32(len(self.attachments))
@@ -226,92 +522,154 @@ class Model(PragmaBase):
             for hitbox in self.hitboxes:
                 hitbox.to_file(writer)
 
-            writer.write_uint16(len(self.skins[0]))
-            writer.write_uint16(len(self.materials))
-            for material in self.materials:
-                writer.write_ascii_string(material)
-
-            writer.write_uint16(len(self.skins))
-            for skin in self.skins:
-                for mat in skin:
-                    writer.write_uint16(self.materials.index(mat))
-
-            mesh_offset = writer.tell()
-            with writer.save_current_pos():
-                writer.seek(offsets_offset + 8)
-                writer.write_uint64(mesh_offset)
-                # writer.write_uint64(0)
+        writer.write_uint16(len(self.skins[0]))
+        writer.write_uint16(len(self.materials))
+        for material in self.materials:
+            writer.write_ascii_string(material)
 
-            self.mesh.to_file(writer)
+        writer.write_uint16(len(self.skins))
+        for skin in self.skins:
+            for mat in skin:
+                writer.write_uint16(writer.context.index(self.materials, mat, by_identity=False))
+        yield 'model_data'
 
-            lod_offset = writer.tell()
-            with writer.save_current_pos():
-                writer.seek(offsets_offset + 16)
-                writer.write_uint64(lod_offset)
+        writer.mark_offset('meshes')
+        self.mesh.to_file(writer)
+        yield 'meshes'
 
-            self.lod_info.to_file(writer)
+        writer.mark_offset('lod_data')
+        self.lod_info.to_file(writer)
+        yield 'lod_data'
 
-            bodygroups_offset = writer.tell()
-            with writer.save_current_pos():
-                writer.seek(offsets_offset + 24)
-                writer.write_uint64(bodygroups_offset)
-            self.mesh.write_bodygroups(writer)
+        writer.mark_offset('bodygroups')
+        self.mesh.write_bodygroups(writer)
+        yield 'bodygroups'
 
-            # if self.collision_mesh.meshes and self.collision_mesh.mass > 0.0:
-            collision_mesh_offset = writer.tell()
-            with writer.save_current_pos():
-                writer.seek(offsets_offset + 32)
-                writer.write_uint64(collision_mesh_offset)
-
-            self.collision_mesh.to_file(writer)
+        # if self.collision_mesh.meshes and self.collision_mesh.mass > 0.0:
+        writer.mark_offset('collision_mesh')
+        self.collision_mesh.to_file(writer)
+        yield 'collision_mesh'
 
+        if self.skinned:
             writer.write_uint16(len(self.blend_controllers))
             for blend in self.blend_controllers:
                 blend.to_file(writer)
 
-            ik_offset = writer.tell()
-            with writer.save_current_pos():
-                writer.seek(offsets_skinned_data + 48)
-                writer.write_uint64(ik_offset)
-
+            writer.mark_offset('ik_controllers')
             writer.write_uint32(len(self.ik_controllers))
             for ik in self.ik_controllers:
                 ik.to_file(writer)
+            yield 'ik_controllers'
 
-            animations_offset = writer.tell()
-            with writer.save_current_pos():
-                writer.seek(offsets_skinned_data + 8)
-                writer.write_uint64(animations_offset)
-
+            writer.mark_offset('animations')
             self.animation_info.to_file(writer)
+            yield 'animations'
 
-            eyeball_offset = writer.tell()
-            with writer.save_current_pos():
-                writer.seek(self.base.skinned_data_offset + 56)
-                writer.write_uint64(eyeball_offset)
-
+            writer.mark_offset('eyeballs')
             writer.write_float(self.max_eye_deflection)
             writer.write_uint32(len(self.eyeballs))
             for eyeball in self.eyeballs:
                 eyeball.to_file(writer)
+            yield 'eyeballs'
 
         writer.write_uint8(len(self.include_models))
         for s in self.include_models:
             writer.write_ascii_string(s)
+        yield 'include_models'
 
     @staticmethod
-    def check_header(reader: ByteIO):
+    def check_header(reader: ByteIO, scan=False):
+        """
+        :param scan: return a ModelScan read from the header and model data prefix (or None for invalid files)
+        instead of a bool. Only bounded parts of the file are read, geometry and animations are skipped.
+        """
         with reader.save_current_pos():
             header = reader.read_ascii_string(3)
             if header != "WMD":
-                return False
+                return None if scan else False
             version = reader.read_uint16()
             if version < 20 or version > MAX_SUPPORTED_VERSION:
-                return False
+                return None if scan else False
+            if scan:
+                return Model._scan(reader, version)
         return True
 
+    @staticmethod
+    def _scan(reader: ByteIO, version):
+        flags = ModelFlags(reader.read_uint32())
+        static = bool(flags & ModelFlags.Static)
+        reader.skip(12)  # eye offset
+        offsets = _read_header_offsets(reader, version, not static)
+        file_size = reader.size()
+        for name, offset in offsets.items():
+            if offset > file_size:
+                raise ValueError(f"{name} {offset} is past the end of the file ({file_size} bytes)")
+
+        reader.seek(offsets['offset_model_data'])
+        material_paths = tuple(reader.read_ascii_string() for _ in range(reader.read_uint8()))
+
+        include_models = None
+        if static:
+            if offsets['offset_collision_mesh'] > 0:
+                reader.seek(offsets['offset_collision_mesh'])
+                include_models = _skip_collision(reader, version) or None
+            else:
+                reader.seek(offsets['offset_bodygroups'])
+                for _ in range(reader.read_uint16()):
+                    reader.read_ascii_string()
+                    reader.skip(reader.read_uint8() * 4)
+                include_models = True
+        elif version >= 28:
+            reader.seek(offsets['offset_eyeballs'])
+            reader.skip(4)  # max eye deflection
+            for _ in range(reader.read_uint32()):
+                Eyeball().from_file(reader)
+            include_models = True
+        if include_models:
+            include_models = tuple(reader.read_ascii_string() for _ in range(reader.read_uint8()))
+
+        starts = sorted((offset, name[7:]) for name, offset in offsets.items() if offset > 0)
+        ends = [offset for offset, _ in starts[1:]] + [file_size]
+        section_sizes = {name: end - start for (start, name), end in zip(starts, ends)}
+        return ModelScan(getattr(reader.file, 'name', ''), version, flags, material_paths,
+                         include_models, section_sizes, file_size)
+
+    @staticmethod
+    def scan_file(path):
+        """Model.check_header(scan=True) on a file, reading only what the scan needs"""
+        reader = ByteIO(file=open(path, 'rb'), copy_data_from_handle=False)
+        try:
+            result = Model.check_header(reader, scan=True)
+        finally:
+            reader.file.close()
+        return result._replace(path=str(path)) if result else None
+
     def __str__(self):
         return f"{self.__class__.__name__}<{'static' if self.static else 'skinned'}>"
 
     def set_name(self, name):
         self.name = name
+
+
+def scan_directory(root, workers=8, recursive=True, extension='.wmd'):
+    """
+    Scans every model file under root with Model.scan_file on a pool of workers threads.
+    Yields (path, ModelScan) in directory walk order, result is None for files that aren't valid models
+    and the raised exception for files that couldn't be read.
+    """
+    if recursive:
+        paths = (os.path.join(directory, name)
+                 for directory, _, names in os.walk(root) for name in names
+                 if name.lower().endswith(extension))
+    else:
+        paths = (entry.path for entry in os.scandir(root)
+                 if entry.is_file() and entry.name.lower().endswith(extension))
+
+    def scan(path):
+        try:
+            return path, Model.scan_file(path)
+        except (OSError, struct.error, NotImplementedError, ValueError, OverflowError) as ex:
+            return path, ex
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(scan, paths)